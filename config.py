@@ -24,11 +24,18 @@ class Config:
         self.restore = args.restore         # checkpoint path if available
         self.use_crf = use_crf              # use crf decoder or not
         self.emb_class = emb_class          # class of embedding(glove, elmo, bert, bert+elmo)
+        self.num_preprocess_workers = 0     # number of processes for building tfrecords shards, 0 for cpu count
+        self.num_parallel_calls = 0         # number of parallel calls for parsing tfrecords, 0 for cpu count
+        self.shuffle_buffer_size = 10000    # buffer size for shuffling training data
+        self.prefetch_size = 2              # number of batches to prefetch
+        self.batch_token_size = 0           # maximum number of tokens per batch(length-bucketed), 0 for fixed batch_size
+        self.bucket_width = 5               # width of sentence length buckets for batch_token_size
 
         self.keep_prob = 0.7                # keep probability for dropout
         self.chr_conv_type = 'conv1d'       # conv1d | conv2d
         self.filter_sizes = [3]             # filter sizes
         self.num_filters = 53               # number of filters
+        self.chr_conv_unique = False        # convolve unique words of a batch only(paddings excluded), scattered back
         self.highway_used = False           # use highway network on the concatenated input
         self.rnn_used = True                # use rnn layer or not
         self.rnn_num_layers = 2             # number of RNN layers
@@ -57,10 +64,15 @@ class Config:
             self.qrnn_filter_size = 3       # size of filter for QRNN
             self.rnn_num_layers = 1
 
+        self.form_table = None              # char-cnn outputs of cached word forms for inference, row 0 for unseen words
+        self.form_vocab = None              # word form -> row of form_table, assigned by load_form_table()
+
         self.is_training = is_training
         if self.is_training:
             self.epoch = args.epoch
             self.batch_size = args.batch_size
+            self.batch_token_size = args.batch_token_size
+            self.bucket_width = args.bucket_width
             self.checkpoint_dir = args.checkpoint_dir
             self.summary_dir = args.summary_dir
 
@@ -77,11 +89,13 @@ class Config:
         '''
         
         if 'elmo' in self.emb_class:
-            from bilm import Batcher, BidirectionalLanguageModel
+            from bilm import BidirectionalLanguageModel
             self.word_length = 50 # replace to fixed word length for the pre-trained elmo : 'max_characters_per_token'
-            self.elmo_batcher = Batcher(self.embvec.elmo_vocab_path, self.word_length) # map text to character ids
+            from elmo_chars import ElmoCharTable
+            self.elmo_char_table = ElmoCharTable(self.embvec.elmo_vocab_path, self.word_length) # map text to character ids(precomputed for elmo vocab)
             self.elmo_bilm = BidirectionalLanguageModel(self.embvec.elmo_options_path, self.embvec.elmo_weight_path) # biLM graph
             self.elmo_keep_prob = 0.7
+            self.use_elmo_feature_store = False # precompute biLM layer activations once and feed them from memory-mapped store(--use_feature_store)
             self.highway_used = False
             '''for KOR
             self.rnn_size = 250
@@ -90,12 +104,17 @@ class Config:
             from bert import modeling
             from bert import tokenization
             self.bert_config = modeling.BertConfig.from_json_file(self.embvec.bert_config_path)
-            self.bert_tokenizer = tokenization.FullTokenizer(
+            from wordpiece import CachedTokenizer
+            bert_tokenizer = tokenization.FullTokenizer(
                 vocab_file=self.embvec.bert_vocab_path, do_lower_case=self.embvec.bert_do_lower_case)
+            self.bert_tokenizer = CachedTokenizer(bert_tokenizer, self.embvec.bert_do_lower_case,
+                                                  cache_size=100000) # per-word cache of word pieces
             self.bert_init_checkpoint = self.embvec.bert_init_checkpoint
             self.bert_max_seq_length = self.embvec.bert_max_seq_length
             self.bert_dim = self.embvec.bert_dim
+            self.bert_layer = self.bert_config.num_hidden_layers - 6 # use output of this layer(base 6, large 18), upper layers are not built
             self.bert_keep_prob = 0.7
+            self.use_bert_feature_store = False # precompute bert embeddings once and feed them from memory-mapped store(--use_feature_store)
             self.highway_used = False
             self.starter_learning_rate = 0.001
             self.use_bert_optimization = False
@@ -107,6 +126,16 @@ class Config:
             self.decay_steps = 5000
             '''
 
+    def load_form_table(self, path):
+        """Load char-cnn outputs of word forms for inference(see inference/export_form_table.py)
+
+        Args:
+          path: path to form table(.npz), forms and table.
+        """
+        data = np.load(path)
+        self.form_table = data['table'].astype(np.float32)
+        self.form_vocab = dict([(form, i + 1) for i, form in enumerate(data['forms'].tolist())])
+
     def update(self, data):
         """Update num_train_steps, num_warmup_steps after reading training data
 
@@ -114,8 +143,9 @@ class Config:
           data: an instance of Input class, training data.
         """
         if not self.is_training: return False
-        self.num_train_steps = int((data.num_examples / self.batch_size) * self.epoch)
-        self.num_warmup_steps = self.num_warmup_epoch * int(data.num_examples / self.batch_size)
+        # data.num_batches is counted after length-bucketing if batch_token_size > 0.
+        self.num_train_steps = int(data.num_batches * self.epoch)
+        self.num_warmup_steps = self.num_warmup_epoch * data.num_batches
         if self.num_warmup_steps == 0: self.num_warmup_steps = 1 # prevent dividing by zero
         return True
 
@@ -0,0 +1,75 @@
+from __future__ import print_function
+import numpy as np
+
+# special character ids of bilm(UnicodeCharsVocabulary), before shifting by 1 for the mask value 0.
+BOS_CHAR = 256 # <begin sentence>
+EOS_CHAR = 257 # <end sentence>
+BOW_CHAR = 258 # <begin word>
+EOW_CHAR = 259 # <end word>
+PAD_CHAR = 260 # <padding>
+
+class ElmoCharTable:
+
+    def __init__(self, vocab_path, max_word_length):
+        """Precomputed elmo character ids of vocab words, same as bilm Batcher.
+
+        Args:
+          vocab_path: path to elmo vocab file written by EmbVec.
+          max_word_length: 'max_characters_per_token' of the pre-trained elmo.
+        """
+        self.max_word_length = max_word_length
+        self.bos_ids = self.__make_bos_eos(BOS_CHAR)
+        self.eos_ids = self.__make_bos_eos(EOS_CHAR)
+        words = []
+        with open(vocab_path, 'r') as f:
+            for line in f:
+                word = line.strip()
+                if not word or word in ['<S>', '</S>']: continue
+                words.append(word)
+        self.word_to_row = {}
+        self.table = np.zeros([len(words), max_word_length], dtype=np.int32)
+        for row, word in enumerate(words):
+            self.word_to_row[word] = row
+            self.table[row] = self.encode_word(word)
+
+    def __make_bos_eos(self, c):
+        code = np.full([self.max_word_length], PAD_CHAR, dtype=np.int32)
+        code[0] = BOW_CHAR
+        code[1] = c
+        code[2] = EOW_CHAR
+        # add one so that 0 is the mask value.
+        return code + 1
+
+    def encode_word(self, word):
+        """Encode a word to character ids(fallback for unseen words).
+        """
+        if word == '<S>': return self.bos_ids
+        if word == '</S>': return self.eos_ids
+        chars = np.frombuffer(word.encode('utf-8', 'ignore')[:(self.max_word_length-2)], dtype=np.uint8)
+        code = np.full([self.max_word_length], PAD_CHAR, dtype=np.int32)
+        code[0] = BOW_CHAR
+        code[1:len(chars)+1] = chars
+        code[len(chars)+1] = EOW_CHAR
+        # add one so that 0 is the mask value.
+        return code + 1
+
+    def encode_sentence(self, words, max_sentence_length, out=None):
+        """Encode words of a sentence with '<S>', '</S>' and zero padding.
+
+        Args:
+          out: zero-filled array to write into, optional.
+        Returns:
+          [max_sentence_length+2, max_word_length]
+        """
+        words = words[:max_sentence_length]
+        n = len(words)
+        if out is None:
+            out = np.zeros([max_sentence_length+2, self.max_word_length], dtype=np.int32)
+        out[0] = self.bos_ids
+        rows = np.array([self.word_to_row.get(word, -1) for word in words], dtype=np.int64)
+        known = rows >= 0
+        out[1:n+1][known] = self.table[rows[known]]
+        for i in np.where(~known)[0]:
+            out[i+1] = self.encode_word(words[i])
+        out[n+1] = self.eos_ids
+        return out
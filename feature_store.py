@@ -0,0 +1,106 @@
+from __future__ import print_function
+import os
+import json
+import numpy as np
+
+# version of feature store layout, bump it when files are changed.
+FEATURE_STORE_VERSION = 2
+
+class FeatureStore:
+
+    def __init__(self, path, feature_shape=None, mode='r'):
+        """Memory-mapped float16 store of word-level features keyed by example index.
+
+        files:
+          path + '.f16'       : features of all examples, [num_rows] + feature_shape
+          path + '.index.npy' : (offset, length) of each example, [num_examples, 2]
+                                length is -1 for an example which was never put
+          path + '.json'      : meta data, written last
+
+        Args:
+          path: path prefix of the store.
+          feature_shape: shape of a word-level feature, ex) [bert_dim]. required for 'w' mode.
+          mode: 'r' for reading(memory-mapped), 'w' for writing.
+        """
+        self.path = path
+        self.mode = mode
+        if mode == 'w':
+            self.feature_shape = list(feature_shape)
+            self.num_rows = 0
+            self.index = {}
+            self.fd = open(path + '.f16', 'wb')
+        else:
+            with open(path + '.json') as f:
+                meta = json.load(f)
+            self.feature_shape = meta['feature_shape']
+            self.num_rows = meta['num_rows']
+            self.index = np.load(path + '.index.npy')
+            shape = tuple([max(1, self.num_rows)] + self.feature_shape)
+            if self.num_rows == 0:
+                self.features = np.zeros(shape, dtype=np.float16)
+            else:
+                self.features = np.memmap(path + '.f16', dtype=np.float16, mode='r', shape=shape)
+
+    @staticmethod
+    def exists(path):
+        """Check whether the store was completely written with the current layout.
+        """
+        if not os.path.exists(path + '.json'): return False
+        with open(path + '.json') as f:
+            meta = json.load(f)
+        return meta.get('version') == FEATURE_STORE_VERSION
+
+    def put(self, ex_index, features):
+        """Append features of an example.
+
+        Args:
+          ex_index: example index.
+          features: [length] + feature_shape
+        """
+        features = np.asarray(features, dtype=np.float16)
+        length = len(features)
+        self.fd.write(features.tobytes())
+        self.index[ex_index] = (self.num_rows, length)
+        self.num_rows += length
+
+    def close(self):
+        if self.mode != 'w': return
+        self.fd.close()
+        num_examples = max(self.index.keys()) + 1 if self.index else 0
+        index = np.zeros([num_examples, 2], dtype=np.int64)
+        index[:, 1] = -1
+        for ex_index, (offset, length) in self.index.items():
+            index[ex_index] = [offset, length]
+        np.save(self.path + '.index.npy', index)
+        meta = {'version': FEATURE_STORE_VERSION, 'feature_shape': self.feature_shape, 'num_rows': self.num_rows, 'num_examples': num_examples}
+        with open(self.path + '.json', 'w') as f:
+            json.dump(meta, f)
+
+    def __index(self, ex_index):
+        """Get (offset, length) of an example, raise ValueError if it was never put.
+        """
+        if ex_index < 0 or ex_index >= len(self.index) or self.index[ex_index][1] < 0:
+            raise ValueError('example %s is not found in %s' % (ex_index, self.path))
+        return self.index[ex_index]
+
+    def get(self, ex_index):
+        """Get features of an example, [length] + feature_shape
+        """
+        offset, length = self.__index(ex_index)
+        return self.features[offset:offset+length]
+
+    def lookup(self, ex_indices, max_length):
+        """Look up features of a batch with zero padding.
+
+        Args:
+          ex_indices: [batch_size]
+          max_length: padded sentence length.
+        Returns:
+          [batch_size, max_length] + feature_shape, float32
+        """
+        out = np.zeros([len(ex_indices), max_length] + self.feature_shape, dtype=np.float32)
+        for i, ex_index in enumerate(ex_indices):
+            offset, length = self.__index(ex_index)
+            length = min(length, max_length)
+            out[i, :length] = self.features[offset:offset+length]
+        return out
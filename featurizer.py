@@ -0,0 +1,197 @@
+from __future__ import print_function
+import collections
+import numpy as np
+
+class BufferArena:
+
+    def __init__(self, bucket_lengths=(16, 32, 64, 128, 256)):
+        """Reusable int32 buffers for input arrays, one per (input key, length bucket).
+        arrays returned by get() are overwritten by the next call with the same key,
+        so they must be consumed(ex, by sess.run) before featurizing the next batch.
+
+        Args:
+          bucket_lengths: upper bounds of sentence length buckets.
+        """
+        self.bucket_lengths = bucket_lengths
+        # (key, bucket length) -> flat int32 buffer
+        self.buffers = {}
+
+    def __bucket_length(self, length):
+        for bucket_length in self.bucket_lengths:
+            if length <= bucket_length: return bucket_length
+        return self.bucket_lengths[-1] * ((length + self.bucket_lengths[-1] - 1) // self.bucket_lengths[-1])
+
+    def get(self, key, shape, fill):
+        """Get a contiguous int32 array filled with fill, backed by a reusable buffer.
+
+        Args:
+          key: input key, ex) 'word_ids'.
+          shape: [batch_size, length, ...]
+          fill: padding value.
+        """
+        size = int(np.prod(shape))
+        bucket_length = self.__bucket_length(shape[1])
+        buf = self.buffers.get((key, bucket_length))
+        if buf is None or buf.size < size:
+            # room for the longest length of the bucket.
+            capacity = size // max(1, shape[1]) * bucket_length
+            buf = np.empty([max(size, capacity)], dtype=np.int32)
+            self.buffers[(key, bucket_length)] = buf
+        out = buf[:size].reshape(shape)
+        out.fill(fill)
+        return out
+
+class Featurizer:
+
+    def __init__(self, config, cache_size=100000, arena=None):
+        """Build input arrays of buckets for inference, without tensorflow.
+        the same features as Input(bucket, config, build_output=False).example, but
+        each line is parsed once and written directly into int32 arrays.
+
+        Args:
+          config: an instance of Config class.
+          cache_size: maximum number of cached words(least recently used ones are evicted).
+          arena: an instance of BufferArena, optional. if given, arrays are reused across calls.
+        """
+        self.config = config
+        self.embvec = config.embvec
+        self.emb_class = config.emb_class
+        self.word_length = config.word_length
+        self.cache_size = cache_size
+        # word -> (wid, chr_ids, form id)
+        self.form_vocab = config.form_vocab if config.form_table is not None else None
+        self.cache = collections.OrderedDict()
+        self.arena = arena
+
+    def __lookup_word(self, word):
+        """Look up word id, character ids and form id(0 if not cached, see Config.load_form_table()) of a word.
+        """
+        entry = self.cache.get(word)
+        if entry is not None:
+            # mark as recently used.
+            del self.cache[word]
+            self.cache[word] = entry
+            return entry
+        chr_ids = np.full([self.word_length], self.embvec.pad_cid, dtype=np.int32)
+        for i, ch in enumerate(word[:self.word_length]):
+            chr_ids[i] = self.embvec.get_cid(ch)
+        fid = self.form_vocab.get(word, 0) if self.form_vocab is not None else 0
+        entry = (self.embvec.get_wid(word), chr_ids, fid)
+        self.cache[word] = entry
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def parse(bucket):
+        """Parse 'word pos chk tag' lines of a bucket.
+
+        Returns:
+          list of (word, pos, chk)
+        """
+        tokens_list = []
+        for line in bucket:
+            tokens = line.split()
+            assert (len(tokens) == 4)
+            tokens_list.append((tokens[0], tokens[1], tokens[2]))
+        return tokens_list
+
+    def alloc(self, key, shape, fill):
+        """Allocate an int32 array for an input.
+        """
+        if self.arena is not None:
+            return self.arena.get(key, shape, fill)
+        return np.full(shape, fill, dtype=np.int32)
+
+    def featurize(self, buckets):
+        """Build padded input arrays of buckets.
+
+        Args:
+          buckets: list of bucket, a bucket is a list of 'word pos chk tag' lines.
+        Returns:
+          dict of int32 arrays, keys are the same as Input.example.
+            word_ids, pos_ids, chk_ids : [batch_size, sentence_length]
+            form_ids                   : [batch_size, sentence_length], only if config.form_table is loaded
+            wordchr_ids                : [batch_size, sentence_length, word_length]
+            elmo_wordchr_ids           : [batch_size, sentence_length+2, word_length]
+            bert_token_ids, bert_token_masks, bert_segment_ids : [batch_size, number of word pieces]
+            bert_wordidx2tokenidx      : [batch_size, sentence_length+1]
+        """
+        parsed = [self.parse(bucket) for bucket in buckets]
+        if 'bert' in self.emb_class:
+            bert_inputs = [self.__bert_input(tokens_list) for tokens_list in parsed]
+            # words without word pieces are dropped, words after bert_max_seq_length are truncated.
+            parsed = [[tokens_list[i] for i in word_idx] for tokens_list, (word_idx, _, _) in zip(parsed, bert_inputs)]
+        batch_size = len(parsed)
+        sentence_length = max([len(tokens_list) for tokens_list in parsed] + [1])
+        embvec = self.embvec
+
+        example = {}
+        word_ids = self.alloc('word_ids', [batch_size, sentence_length], embvec.pad_wid)
+        wordchr_ids = self.alloc('wordchr_ids', [batch_size, sentence_length, self.word_length], embvec.pad_cid)
+        pos_ids = self.alloc('pos_ids', [batch_size, sentence_length], embvec.pad_pid)
+        chk_ids = self.alloc('chk_ids', [batch_size, sentence_length], embvec.pad_kid)
+        form_ids = None
+        if self.form_vocab is not None:
+            form_ids = self.alloc('form_ids', [batch_size, sentence_length], 0)
+        for b, tokens_list in enumerate(parsed):
+            for i, (word, pos, chk) in enumerate(tokens_list):
+                wid, chr_ids, fid = self.__lookup_word(word)
+                word_ids[b, i] = wid
+                wordchr_ids[b, i] = chr_ids
+                if form_ids is not None: form_ids[b, i] = fid
+                pos_ids[b, i] = embvec.get_pid(pos)
+                chk_ids[b, i] = embvec.get_kid(chk)
+        example['word_ids'] = word_ids
+        example['wordchr_ids'] = wordchr_ids
+        example['pos_ids'] = pos_ids
+        example['chk_ids'] = chk_ids
+        if form_ids is not None:
+            example['form_ids'] = form_ids
+
+        if 'elmo' in self.emb_class:
+            elmo_char_table = self.config.elmo_char_table
+            elmo_wordchr_ids = self.alloc('elmo_wordchr_ids', [batch_size, sentence_length+2, self.word_length], 0)
+            for b, tokens_list in enumerate(parsed):
+                words = [tokens[0] for tokens in tokens_list]
+                elmo_char_table.encode_sentence(words, sentence_length, out=elmo_wordchr_ids[b])
+            example['elmo_wordchr_ids'] = elmo_wordchr_ids
+
+        if 'bert' in self.emb_class:
+            token_length = max([len(token_ids) for _, token_ids, _ in bert_inputs])
+            bert_token_ids = self.alloc('bert_token_ids', [batch_size, token_length], 0)
+            bert_token_masks = self.alloc('bert_token_masks', [batch_size, token_length], 0)
+            bert_segment_ids = self.alloc('bert_segment_ids', [batch_size, token_length], 0)
+            bert_wordidx2tokenidx = self.alloc('bert_wordidx2tokenidx', [batch_size, sentence_length+1], 0)
+            for b, (_, token_ids, wordidx2tokenidx) in enumerate(bert_inputs):
+                bert_token_ids[b, :len(token_ids)] = token_ids
+                bert_token_masks[b, :len(token_ids)] = 1
+                bert_wordidx2tokenidx[b, :len(wordidx2tokenidx)] = wordidx2tokenidx
+            example['bert_token_ids'] = bert_token_ids
+            example['bert_token_masks'] = bert_token_masks
+            example['bert_segment_ids'] = bert_segment_ids
+            example['bert_wordidx2tokenidx'] = bert_wordidx2tokenidx
+        return example
+
+    def __bert_input(self, tokens_list):
+        """Create word pieces of a sentence, same as Input.__create_bert_input().
+
+        Returns:
+          indices of words which have word pieces,
+          bert token ids,
+          bert wordidx to tokenidx(including last+1 token idx)
+        """
+        bert_tokenizer = self.config.bert_tokenizer
+        bert_max_seq_length = self.config.bert_max_seq_length
+        word_idx = []
+        token_ids = [bert_tokenizer.cls_id]
+        wordidx2tokenidx = []
+        for i, tokens in enumerate(tokens_list):
+            _, ids = bert_tokenizer.tokenize_word(tokens[0])
+            if ids:
+                word_idx.append(i)
+                wordidx2tokenidx.append(len(token_ids))
+                token_ids.extend(ids)
+            if len(token_ids) == bert_max_seq_length - 1: break
+        wordidx2tokenidx.append(len(token_ids))
+        return word_idx, token_ids, wordidx2tokenidx
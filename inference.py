@@ -7,78 +7,132 @@ import numpy as np
 from embvec import EmbVec
 from config import Config
 from model import Model
-from input import Input
+from featurizer import Featurizer
+from pipeline import Pipeline, read_buckets
 import feed
 
+def tag_chunk(config, model, featurizer, chunk, batch_size):
+    """Tag a chunk of buckets by length-sorted padded batches.
+
+    Args:
+      chunk: list of bucket.
+      batch_size: number of buckets per batch.
+    Returns:
+      list of tag sequence, in the order of chunk.
+    """
+    sess = model.sess
+    # sort by length so that each batch is padded to a similar length.
+    order = sorted(range(len(chunk)), key=lambda i: len(chunk[i]))
+    tags_list = [None] * len(chunk)
+    for start in range(0, len(order), batch_size):
+        indices = order[start:start+batch_size]
+        buckets = [chunk[i] for i in indices]
+        feed_dict = feed.build_batch_input_feed_dict(model, buckets, featurizer)
+        logits_indices, sentence_lengths = sess.run([model.logits_indices, model.sentence_lengths], feed_dict=feed_dict)
+        for b, i in enumerate(indices):
+            tags_list[i] = config.logit_indices_to_tags(logits_indices[b], sentence_lengths[b])
+    return tags_list
+
+def inference_bulk(config, batch_size, chunk_size):
+    """Inference for a CoNLL file, by large padded batches.
+    """
+
+    # create model(forward graph only) and restore variables
+    model = Model(config)
+    model.build_for_inference()
+    sess = model.sess
+    tf.logging.info('model restored' +'\n')
+    featurizer = Featurizer(config)
+
+    num_sentences = 0
+    start_time = time.time()
+    chunk = []
+    def flush(chunk):
+        tags_list = tag_chunk(config, model, featurizer, chunk, batch_size)
+        # write back in the input order.
+        for bucket, tags in zip(chunk, tags_list):
+            for i in range(len(bucket)):
+                out = bucket[i] + ' ' + tags[i]
+                sys.stdout.write(out + '\n')
+            sys.stdout.write('\n')
+        return len(chunk)
+    for bucket in read_buckets(sys.stdin):
+        chunk.append(bucket)
+        if len(chunk) == chunk_size:
+            num_sentences += flush(chunk)
+            chunk = []
+            tf.logging.info('%s sentences, %.1f sentences/sec' % (num_sentences, num_sentences / (time.time() - start_time)))
+    if chunk: num_sentences += flush(chunk)
+    duration_time = time.time() - start_time
+
+    out = 'total_duration_time : ' + str(duration_time) + ' sec' + '\n'
+    out += 'number of sentences : ' + str(num_sentences) + '\n'
+    out += 'sentences/sec : ' + str(num_sentences / max(duration_time, 1e-9))
+    tf.logging.info(out)
+
+    sess.close()
+
 def inference_bucket(config):
     """Inference for bucket.
     """
 
-    # create model and compile
+    # create model(forward graph only) and restore variables
     model = Model(config)
-    model.compile()
+    model.build_for_inference()
     sess = model.sess
-
-    # restore model
-    saver = tf.train.Saver()
-    saver.restore(sess, config.restore)
     sys.stderr.write('model restored' +'\n')
+    featurizer = Featurizer(config)
     '''
     print(tf.global_variables())
     print(tf.trainable_variables())
     '''
+    # stages : parse(reader thread) -> featurize -> run -> format, connected by bounded queues.
+    # each stage is timed by itself, so duration_time excludes waiting in the queues(same as sequential processing),
+    # latency is measured from the time a bucket is read to the time it is written(end-to-end).
+    def read_timed(f):
+        for bucket in read_buckets(f):
+            yield bucket, time.time()
+    def featurize(item):
+        bucket, read_time = item
+        start_time = time.time()
+        feed_dict = feed.build_input_feed_dict(model, bucket, featurizer)
+        return bucket, feed_dict, read_time, [time.time() - start_time]
+    def run(item):
+        bucket, feed_dict, read_time, durations = item
+        start_time = time.time()
+        logits_indices, sentence_lengths = sess.run([model.logits_indices, model.sentence_lengths], feed_dict=feed_dict)
+        durations.append(time.time() - start_time)
+        return bucket, logits_indices, sentence_lengths, read_time, durations
+    def format_tags(item):
+        bucket, logits_indices, sentence_lengths, read_time, durations = item
+        start_time = time.time()
+        tags = config.logit_indices_to_tags(logits_indices[0], sentence_lengths[0])
+        out = [bucket[i] + ' ' + tags[i] + '\n' for i in range(len(bucket))]
+        durations.append(time.time() - start_time)
+        return ''.join(out) + '\n', read_time, durations
+
     num_buckets = 0
     total_duration_time = 0.0
-    bucket = []
-    while 1:
-        try: line = sys.stdin.readline()
-        except KeyboardInterrupt: break
-        if not line: break
-        line = line.strip()
-        if not line and len(bucket) >= 1:
-            start_time = time.time()
-            inp, feed_dict = feed.build_input_feed_dict(model, bucket, Input)
-            if 'bert' in config.emb_class:
-                # compute bert embedding at runtime
-                bert_embeddings = sess.run([model.bert_embeddings_subgraph], feed_dict=feed_dict)
-                # update feed_dict
-                feed_dict[model.bert_embeddings] = feed.align_bert_embeddings(config, bert_embeddings, inp.example['bert_wordidx2tokenidx'], -1)
-            logits_indices, sentence_lengths = sess.run([model.logits_indices, model.sentence_lengths], feed_dict=feed_dict)
-            tags = config.logit_indices_to_tags(logits_indices[0], sentence_lengths[0])
-            for i in range(len(bucket)):
-                out = bucket[i] + ' ' + tags[i]
-                sys.stdout.write(out + '\n')
-            sys.stdout.write('\n')
-            bucket = []
-            duration_time = time.time() - start_time
+    total_latency = 0.0
+    pipeline = Pipeline(read_timed(sys.stdin), [featurize, run, format_tags])
+    try:
+        for out, read_time, durations in pipeline:
+            sys.stdout.write(out)
+            duration_time = sum(durations)
+            latency = time.time() - read_time
             out = 'duration_time : ' + str(duration_time) + ' sec'
+            out += ' (featurize %s, run %s, format %s)' % tuple(durations)
+            out += ', latency : ' + str(latency) + ' sec'
             tf.logging.info(out)
             num_buckets += 1
             if num_buckets != 1: # first one may takes longer time, so ignore in computing duration.
                 total_duration_time += duration_time
-        if line : bucket.append(line)
-    if len(bucket) != 0:
-        start_time = time.time()
-        inp, feed_dict = feed.build_input_feed_dict(model, bucket, Input)
-        if 'bert' in config.emb_class:
-            # compute bert embedding at runtime
-            bert_embeddings = sess.run([model.bert_embeddings_subgraph], feed_dict=feed_dict)
-            # update feed_dict
-            feed_dict[model.bert_embeddings] = feed.align_bert_embeddings(config, bert_embeddings, inp.example['bert_wordidx2tokenidx'], -1)
-        logits_indices, sentence_lengths = sess.run([model.logits_indices, model.sentence_lengths], feed_dict=feed_dict)
-        tags = config.logit_indices_to_tags(logits_indices[0], sentence_lengths[0])
-        for i in range(len(bucket)):
-            out = bucket[i] + ' ' + tags[i]
-            sys.stdout.write(out + '\n')
-        sys.stdout.write('\n')
-        duration_time = time.time() - start_time
-        out = 'duration_time : ' + str(duration_time) + ' sec'
-        tf.logging.info(out)
-        num_buckets += 1
-        total_duration_time += duration_time
+                total_latency += latency
+    except KeyboardInterrupt: pass
 
     out = 'total_duration_time : ' + str(total_duration_time) + ' sec' + '\n'
-    out += 'average processing time / bucket : ' + str(total_duration_time / (num_buckets-1)) + ' sec'
+    out += 'average processing time / bucket : ' + str(total_duration_time / (num_buckets-1)) + ' sec' + '\n'
+    out += 'average latency / bucket : ' + str(total_latency / (num_buckets-1)) + ' sec'
     tf.logging.info(out)
 
     sess.close()
@@ -117,39 +171,44 @@ def inference_line(config):
     import spacy
     nlp = spacy.load('en')
 
-    # create model and compile
+    # create model(forward graph only) and restore variables
     model = Model(config)
-    model.compile()
+    model.build_for_inference()
     sess = model.sess
-
-    # restore model
-    saver = tf.train.Saver()
-    saver.restore(sess, config.restore)
     tf.logging.info('model restored' +'\n')
+    featurizer = Featurizer(config)
 
-    while 1:
-        try: line = sys.stdin.readline()
-        except KeyboardInterrupt: break
-        if not line: break
-        line = line.strip()
-        if not line: continue
-        # create bucket
-        try: bucket = build_bucket(nlp, line)
-        except Exception as e:
-            sys.stderr.write(str(e) +'\n')
-            continue
-        inp, feed_dict = feed.build_input_feed_dict(model, bucket)
-        if 'bert' in config.emb_class:
-            # compute bert embedding at runtime
-            bert_embeddings = sess.run([model.bert_embeddings_subgraph], feed_dict=feed_dict)
-            # update feed_dict
-            feed_dict[model.bert_embeddings] = feed.align_bert_embeddings(config, bert_embeddings, inp.example['bert_wordidx2tokenidx'], -1)
+    # stages : parse(reader thread, spacy) -> featurize -> run -> format, connected by bounded queues.
+    def read_lines(f):
+        while 1:
+            line = f.readline()
+            if not line: break
+            line = line.strip()
+            if not line: continue
+            # create bucket
+            try: bucket = build_bucket(nlp, line)
+            except Exception as e:
+                sys.stderr.write(str(e) +'\n')
+                continue
+            yield bucket
+    def featurize(bucket):
+        return bucket, feed.build_input_feed_dict(model, bucket, featurizer)
+    def run(item):
+        bucket, feed_dict = item
         logits_indices, sentence_lengths = sess.run([model.logits_indices, model.sentence_lengths], feed_dict=feed_dict)
+        return bucket, logits_indices, sentence_lengths
+    def format_tags(item):
+        bucket, logits_indices, sentence_lengths = item
         tags = config.logit_indices_to_tags(logits_indices[0], sentence_lengths[0])
-        for i in range(len(bucket)):
-            out = bucket[i] + ' ' + tags[i]
-            sys.stdout.write(out + '\n')
-        sys.stdout.write('\n')
+        out = [bucket[i] + ' ' + tags[i] + '\n' for i in range(len(bucket))]
+        return ''.join(out) + '\n'
+
+    pipeline = Pipeline(read_lines(sys.stdin), [featurize, run, format_tags])
+    try:
+        for out in pipeline:
+            sys.stdout.write(out)
+            sys.stdout.flush()
+    except KeyboardInterrupt: pass
 
     sess.close()
 
@@ -160,10 +219,13 @@ if __name__ == '__main__':
     parser.add_argument('--word_length', type=int, default=15, help='max word length')
     parser.add_argument('--restore', type=str, help='path to saved model(ex, ./checkpoint/ner_model)', required=True)
     parser.add_argument('--mode', type=str, default='bulk', help='bulk, bucket, line')
+    parser.add_argument('--batch_size', type=int, default=128, help='number of sentences per batch, for bulk mode')
+    parser.add_argument('--chunk_size', type=int, default=10000, help='number of sentences sorted by length at a time, for bulk mode')
 
     args = parser.parse_args()
     tf.logging.set_verbosity(tf.logging.INFO)
 
     config = Config(args, is_training=False, emb_class='glove', use_crf=True)
+    if args.mode == 'bulk':   inference_bulk(config, args.batch_size, args.chunk_size)
     if args.mode == 'bucket': inference_bucket(config)
     if args.mode == 'line':   inference_line(config)
@@ -0,0 +1,113 @@
+from __future__ import print_function
+import sys
+import os
+import time
+import argparse
+import collections
+import numpy as np
+import tensorflow as tf
+# for LSTMBlockFusedCell(), https://github.com/tensorflow/tensorflow/issues/23369
+tf.contrib.rnn
+# for QRNN
+try: import qrnn
+except: sys.stderr.write('import qrnn, failed\n')
+
+dir = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(dir + '/..')
+from embvec import EmbVec
+from config import Config
+from model import Model
+from featurizer import Featurizer
+from feed import build_batch_input_feed_dict
+
+def collect_forms(config, data_paths, top_n, max_vocab_size):
+    """Collect word forms to be cached, in-vocabulary words and top-n frequent surface forms of data files.
+
+    Args:
+      data_paths: list of CoNLL files(ex, ../data/train.txt).
+      top_n: number of frequent surface forms.
+      max_vocab_size: number of in-vocabulary words(in the order of word ids), 0 for all.
+    Returns:
+      list of forms
+    """
+    embvec = config.embvec
+    vocab = sorted([(wid, word) for word, wid in embvec.wrd_vocab.items() if wid not in [embvec.pad_wid, embvec.unk_wid]])
+    if max_vocab_size > 0: vocab = vocab[:max_vocab_size]
+    counter = collections.Counter()
+    for path in data_paths:
+        with open(path) as f:
+            for line in f:
+                tokens = line.split()
+                if len(tokens) != 4 or tokens[0] == '-DOCSTART-': continue
+                counter[tokens[0]] += 1
+    forms = collections.OrderedDict()
+    for _, word in vocab: forms[word] = True
+    for word, _ in counter.most_common(top_n): forms[word] = True
+    # forms are featurized as 'word pos chk tag' lines.
+    return [form for form in forms if len(form.split()) == 1]
+
+def export_table(config, args):
+    """Compute char-cnn outputs of word forms by the restored model and save them to form table(.npz).
+    """
+    forms = collect_forms(config, [path for path in args.data_path.split(',') if path], args.top_n, args.max_vocab_size)
+    sys.stderr.write('number of forms : %s\n' % len(forms))
+
+    # create model(forward graph only) and restore variables
+    model = Model(config)
+    model.build_for_inference()
+    sess = model.sess
+    featurizer = Featurizer(config)
+
+    start_time = time.time()
+    table = np.zeros([len(forms) + 1, int(model.wordchr_embeddings.shape[-1])], dtype=np.float32)
+    for start in range(0, len(forms), args.batch_size):
+        # a form is a sentence of one word.
+        buckets = [[form + ' X X O'] for form in forms[start:start+args.batch_size]]
+        feed_dict = build_batch_input_feed_dict(model, buckets, featurizer)
+        wordchr_embeddings = sess.run(model.wordchr_embeddings, feed_dict=feed_dict) # (batch_size, 1, filters)
+        table[start+1:start+1+len(buckets)] = wordchr_embeddings[:, 0]
+    sess.close()
+    sys.stderr.write('duration_time : %s sec\n' % (time.time() - start_time))
+
+    np.savez(args.form_table_path, forms=np.array(forms), table=table)
+    print('table %s, %.1f MB, exported to %s' % (table.shape, table.nbytes / float(1 << 20), args.form_table_path))
+
+def export_model(config, args):
+    """Export the model with word form cache for freeze.py, same as export.py.
+    """
+    config.load_form_table(args.form_table_path)
+    # create model(forward graph only, char-cnn for unseen words) and restore variables
+    model = Model(config)
+    model.build_for_inference()
+    sess = model.sess
+    with sess.as_default():
+        saver = tf.train.Saver(tf.global_variables())
+        saver.save(sess, args.export)
+        tf.train.write_graph(sess.graph, args.export_pb, "graph.pb", as_text=False)
+        print('model exported')
+    sess.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--emb_path', type=str, help='path to word embedding vector + vocab(.pkl)', required=True)
+    parser.add_argument('--wrd_dim', type=int, help='dimension of word embedding vector', required=True)
+    parser.add_argument('--word_length', type=int, default=15, help='max word length')
+    parser.add_argument('--restore', type=str, help='path to saved model(ex, ../checkpoint/ner_model)', required=True)
+    parser.add_argument('--form_table_path', type=str, help='path to form table(ex, exported/ner_form_table.npz)', required=True)
+    parser.add_argument('--mode', type=str, default='table', help='table, export')
+    parser.add_argument('--data_path', type=str, default='', help='comma separated CoNLL files for frequent surface forms(ex, ../data/train.txt)')
+    parser.add_argument('--top_n', type=int, default=50000, help='number of frequent surface forms')
+    parser.add_argument('--max_vocab_size', type=int, default=0, help='number of in-vocabulary words, 0 for all')
+    parser.add_argument('--batch_size', type=int, default=4096, help='number of forms per batch')
+    parser.add_argument('--export', type=str, default='', help='path to exporting model for export mode(ex, exported/ner_model)')
+    parser.add_argument('--export-pb', type=str, default='', help='path to exporting graph proto for export mode(ex, exported)')
+
+    args = parser.parse_args()
+    tf.logging.set_verbosity(tf.logging.INFO)
+
+    config = Config(args, is_training=False, emb_class='glove', use_crf=True)
+    if args.mode == 'table': export_table(config, args)
+    if args.mode == 'export':
+        if not args.export or not args.export_pb:
+            parser.error('--export and --export-pb are required for export mode')
+        export_model(config, args)
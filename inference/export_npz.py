@@ -0,0 +1,117 @@
+from __future__ import print_function
+import sys
+import re
+import argparse
+import numpy as np
+import tensorflow as tf
+# for LSTMBlockFusedCell(), https://github.com/tensorflow/tensorflow/issues/23369
+tf.contrib.rnn
+# for QRNN
+try: import qrnn
+except: sys.stderr.write('import qrnn, failed\n')
+
+def read_checkpoint(restore):
+    """Read variables of a checkpoint.
+
+    Returns:
+      dict, variable name -> ndarray
+    """
+    reader = tf.train.NewCheckpointReader(restore)
+    values = {}
+    for name in reader.get_variable_to_shape_map():
+        values[name] = reader.get_tensor(name)
+    return values
+
+def read_frozen_graph(frozen_path):
+    """Read constants of a frozen graph(variables are converted to constants with the same names).
+
+    Returns:
+      dict, constant name -> ndarray
+    """
+    with tf.gfile.GFile(frozen_path, "rb") as f:
+        graph_def = tf.GraphDef()
+        graph_def.ParseFromString(f.read())
+    values = {}
+    for node in graph_def.node:
+        if node.op != 'Const': continue
+        values[node.name] = tf.make_ndarray(node.attr['value'].tensor)
+    return values
+
+def build_weights(values):
+    """Map variables of the glove model to keys of NumpyModel(numpy_model.py).
+
+    Args:
+      values: dict, variable name -> ndarray
+    Returns:
+      dict, key -> float32 ndarray
+    """
+    weights = {}
+    def put(key, name, required=True):
+        if name not in values:
+            if required: raise ValueError('%s is not found' % name)
+            return False
+        weights[key] = np.asarray(values[name], dtype=np.float32)
+        return True
+
+    put('wrd_embeddings', 'wrd_embeddings')
+    put('p_embeddings', 'pos-embedding/p_embeddings')
+    put('k_embeddings', 'chk-embedding/k_embeddings')
+    # character embeddings, conv1d or conv2d
+    if put('conv1d_chr_embeddings', 'wordchr-embedding-conv1d/chr_embeddings', required=False):
+        put('conv1d_kernel', 'wordchr-embedding-conv1d/conv1d/kernel')
+        put('conv1d_bias', 'wordchr-embedding-conv1d/conv1d/bias')
+    else:
+        put('conv2d_chr_embeddings', 'wordchr-embedding-conv2d/chr_embeddings')
+        for name in values:
+            m = re.match(r'^wordchr-embedding-conv2d/conv-maxpool-(\d+)/W$', name)
+            if not m: continue
+            put('conv2d_W_%s' % m.group(1), name)
+            put('conv2d_b_%s' % m.group(1), 'wordchr-embedding-conv2d/conv-maxpool-%s/b' % m.group(1))
+    # highway network
+    idx = 0
+    while put('highway_lin_Matrix_%s' % idx, 'highway/highway_lin_%d/Matrix' % idx, required=False):
+        put('highway_lin_Bias_%s' % idx, 'highway/highway_lin_%d/Bias' % idx)
+        put('highway_gate_Matrix_%s' % idx, 'highway/highway_gate_%d/Matrix' % idx)
+        put('highway_gate_Bias_%s' % idx, 'highway/highway_gate_%d/Bias' % idx)
+        idx += 1
+    # fused bi-lstm layers, the forward cell is created first, so its scope name sorts first.
+    # ex) bi-lstm-fused-0/lstm_cell/kernel, bi-lstm-fused-0/lstm_cell_1/kernel
+    idx = 0
+    while True:
+        scope = 'bi-lstm-fused-%s/' % idx
+        kernels = sorted([name for name in values if name.startswith(scope) and name.endswith('/kernel')])
+        biases = sorted([name for name in values if name.startswith(scope) and name.endswith('/bias')])
+        if not kernels: break
+        if len(kernels) != 2 or len(biases) != 2:
+            raise ValueError('unexpected variables in %s : %s, %s' % (scope, kernels, biases))
+        put('lstm_fw_kernel_%s' % idx, kernels[0])
+        put('lstm_fw_bias_%s' % idx, biases[0])
+        put('lstm_bw_kernel_%s' % idx, kernels[1])
+        put('lstm_bw_bias_%s' % idx, biases[1])
+        idx += 1
+    put('projection_W', 'projection/W')
+    put('projection_b', 'projection/b')
+    put('trans_params', 'trans_params')
+    return weights
+
+def export_npz(args):
+    if args.restore: values = read_checkpoint(args.restore)
+    else: values = read_frozen_graph(args.frozen_path)
+    weights = build_weights(values)
+    np.savez(args.npz_path, **weights)
+    total = 0
+    for key in sorted(weights):
+        print(key, weights[key].shape)
+        total += weights[key].nbytes
+    print('total %.1f MB, exported to %s' % (total / float(1 << 20), args.npz_path))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--restore', type=str, default='', help='path to saved model(ex, ../checkpoint/ner_model)')
+    parser.add_argument('--frozen_path', type=str, default='', help='path to frozen model(ex, exported/ner_frozen.pb)')
+    parser.add_argument('--npz_path', type=str, help='path to exporting weights(ex, exported/ner_model.npz)', required=True)
+
+    args = parser.parse_args()
+    if not args.restore and not args.frozen_path:
+        parser.error('--restore or --frozen_path is required')
+    export_npz(args)
@@ -1,4 +1,6 @@
 import sys, os, argparse
+import time
+import numpy as np
 import tensorflow as tf
 # for LSTMBlockFusedCell(), https://github.com/tensorflow/tensorflow/issues/23369
 tf.contrib.rnn
@@ -14,6 +16,11 @@ source is from https://gist.github.com/morgangiraud/249505f540a5e53a48b0c1a869d3
 # from tensorflow.python.tools.freeze_graph import freeze_graph 
 
 dir = os.path.dirname(os.path.realpath(__file__))
+# for evaluating frozen graphs by Predictor
+sys.path.append(dir + '/..')
+
+# placeholders whose default values are computed by the graph itself(ex, biLM, bert), not by the dataset iterator.
+KEEP_DEFAULT_NODES = ['elmo_layers', 'bert_embeddings']
 
 def modify_op(graph_def):
     """
@@ -29,9 +36,337 @@ def modify_op(graph_def):
                 # input1: value: The value to be assigned to the variable.
                 node.input[0] = node.input[1]
                 del node.input[1]
+        if node.op == 'PlaceholderWithDefault' and node.name not in KEEP_DEFAULT_NODES:
+            # input placeholders of the training graph take default values from the dataset iterator.
+            # turn them back to plain placeholders, so that the iterator is pruned.
+            node.op = 'Placeholder'
+            del node.input[:]
     return graph_def
 
-def freeze_graph(model_dir, output_node_names, frozen_model_name, optimize_graph_def=0):
+def _input_name(name):
+    """Strip the control dependency marker and the output index from a node input.
+    """
+    return name.lstrip('^').split(':')[0]
+
+def _const_node(name, value):
+    node = tf.NodeDef()
+    node.op = 'Const'
+    node.name = name
+    node.attr['dtype'].type = tf.as_dtype(value.dtype).as_datatype_enum
+    node.attr['value'].tensor.CopyFrom(tf.make_tensor_proto(value))
+    return node
+
+def _cast_node(name, x, src_dtype):
+    node = tf.NodeDef()
+    node.op = 'Cast'
+    node.name = name
+    node.input.extend([x])
+    node.attr['SrcT'].type = src_dtype.as_datatype_enum
+    node.attr['DstT'].type = tf.float32.as_datatype_enum
+    return node
+
+def _mul_node(name, x, y):
+    node = tf.NodeDef()
+    node.op = 'Mul'
+    node.name = name
+    node.input.extend([x, y])
+    node.attr['T'].type = tf.float32.as_datatype_enum
+    return node
+
+def _dequantize_nodes(name, stored, mode, gather=None):
+    """Build nodes computing the float32 value of a compressed constant, named 'name'.
+    if gather(a Gather node on the constant) is given, gather the compressed rows first.
+    """
+    nodes = []
+    inputs = []
+    for stored_name, value in stored:
+        if gather is None:
+            inputs.append(stored_name)
+            continue
+        node = tf.NodeDef()
+        node.CopyFrom(gather)
+        node.name = name + '/' + stored_name.split('/')[-1]
+        node.input[0] = stored_name
+        node.attr['Tparams'].type = tf.as_dtype(value.dtype).as_datatype_enum
+        if '_class' in node.attr: del node.attr['_class']
+        nodes.append(node)
+        inputs.append(node.name)
+    if mode == 'int8':
+        nodes.append(_cast_node(name + '/dequantize', inputs[0], tf.int8))
+        nodes.append(_mul_node(name, name + '/dequantize', inputs[1]))
+    else:
+        nodes.append(_cast_node(name, inputs[0], tf.float16))
+    return nodes
+
+def compress_graph_def(graph_def, output_node_names, mode='int8', min_size=16384):
+    """Store large float32 constants(embeddings, lstm kernels, ...) as int8 with per-row scales or float16,
+    and dequantize them in graph. for constants used by embedding lookups only,
+    the compressed rows are gathered first, so the whole table is not dequantized for each run.
+
+    Args:
+      graph_def: frozen graph_def.
+      output_node_names: a string, containing all the output node's names, comma separated
+      mode: 'int8' | 'float16'
+      min_size: minimum number of elements of a constant to be compressed.
+    Returns:
+      compressed graph_def
+    """
+    consumers = {}
+    consts = {}
+    for node in graph_def.node:
+        if node.op == 'Const': consts[node.name] = node
+        for idx, name in enumerate(node.input):
+            consumers.setdefault(_input_name(name), []).append((node, idx))
+    def terminal_consumers(name):
+        out = []
+        for node, idx in consumers.get(name, []):
+            if node.op == 'Identity': out.extend(terminal_consumers(node.name))
+            else: out.append((node, idx))
+        return out
+    def is_row_gather(node, idx):
+        if node.op == 'Gather': return idx == 0
+        if node.op != 'GatherV2' or idx != 0: return False
+        axis = consts.get(_input_name(node.input[2]))
+        return axis is not None and tf.make_ndarray(axis.attr['value'].tensor) == 0
+
+    targets = {}
+    for node in graph_def.node:
+        if node.op != 'Const' or node.attr['dtype'].type != tf.float32.as_datatype_enum: continue
+        value = tf.make_ndarray(node.attr['value'].tensor)
+        if value.ndim < 2 or value.size < min_size: continue
+        targets[node.name] = value
+
+    new_nodes = []
+    replaced = {}  # gather node name -> nodes
+    for name, value in targets.items():
+        if mode == 'int8':
+            rows = value.reshape([value.shape[0], -1])
+            scale = np.max(np.abs(rows), axis=1) / 127.0
+            scale[scale == 0] = 1.0
+            quantized = np.round(rows / scale[:, np.newaxis]).astype(np.int8).reshape(value.shape)
+            scale = scale.astype(np.float32).reshape([value.shape[0]] + [1] * (value.ndim - 1))
+            stored = [(name + '/quantized', quantized), (name + '/scale', scale)]
+        else:
+            stored = [(name + '/half', value.astype(np.float16))]
+        new_nodes.extend([_const_node(stored_name, v) for stored_name, v in stored])
+        terminals = terminal_consumers(name)
+        if terminals and all([is_row_gather(node, idx) for node, idx in terminals]):
+            for node, _ in terminals:
+                replaced[node.name] = _dequantize_nodes(node.name, stored, mode, gather=node)
+        else:
+            new_nodes.extend(_dequantize_nodes(name, stored, mode))
+        print('compressed %s %s to %s' % (name, list(value.shape), mode))
+
+    output_graph_def = tf.GraphDef()
+    output_graph_def.versions.CopyFrom(graph_def.versions)
+    output_graph_def.library.CopyFrom(graph_def.library)
+    for node in graph_def.node:
+        if node.name in targets: continue
+        if node.name in replaced:
+            output_graph_def.node.extend(replaced[node.name])
+            continue
+        output_graph_def.node.extend([node])
+    output_graph_def.node.extend(new_nodes)
+    # colocation with removed constants is not valid anymore.
+    for node in output_graph_def.node:
+        if '_class' not in node.attr: continue
+        locs = [loc for loc in node.attr['_class'].list.s if loc.decode('utf-8')[len('loc:@'):] not in targets]
+        del node.attr['_class'].list.s[:]
+        node.attr['_class'].list.s.extend(locs)
+        if not locs: del node.attr['_class']
+    # remove nodes which are not used anymore, ex) 'wrd_embeddings/read'
+    return tf.graph_util.extract_sub_graph(output_graph_def, output_node_names.split(','))
+
+def _identity_node(name, x, dtype_attr):
+    node = tf.NodeDef()
+    node.op = 'Identity'
+    node.name = name
+    node.input.extend([x])
+    node.attr['T'].CopyFrom(dtype_attr)
+    return node
+
+def fold_is_train(graph_def, is_train_name='is_train'):
+    """Fix is_train=False and fold the conds on it(keep probabilities for dropout).
+    Switch nodes on a constant predicate become Identity of the live output,
+    nodes depending on the dead output are removed and Merge nodes become Identity of the live input.
+
+    Returns:
+      graph_def
+    """
+    nodes = dict([(node.name, node) for node in graph_def.node])
+    if is_train_name not in nodes: return graph_def
+    is_train = _const_node(is_train_name, np.array(False))
+    def const_value(name):
+        # follow Identity nodes to a Const.
+        name = _input_name(name)
+        while name in nodes and nodes[name].op == 'Identity':
+            name = _input_name(nodes[name].input[0])
+        if name == is_train_name: return False
+        if name in nodes and nodes[name].op == 'Const':
+            return tf.make_ndarray(nodes[name].attr['value'].tensor)
+        return None
+    # dead outputs of Switch nodes, 'name:1' for False predicate, 'name:0' for True.
+    switches = {}
+    dead = set()
+    for node in graph_def.node:
+        if node.op != 'Switch': continue
+        pred = const_value(node.input[1])
+        if pred is None: continue
+        switches[node.name] = bool(pred)
+        dead.add(node.name + (':0' if pred else ':1'))
+    def is_dead(name):
+        if name.startswith('^'): name = name[1:]
+        if ':' not in name: name += ':0'
+        return name in dead or name.split(':')[0] in dead_nodes
+    dead_nodes = set()
+    changed = True
+    while changed:
+        changed = False
+        for node in graph_def.node:
+            if node.name in dead_nodes or node.name in switches: continue
+            if node.op == 'Merge': dead_node = all([is_dead(x) for x in node.input])
+            else: dead_node = any([is_dead(x) for x in node.input])
+            if dead_node:
+                dead_nodes.add(node.name)
+                changed = True
+
+    # folded nodes have a single output, so consumers of their other outputs are rewired.
+    #   'switch:1'(live for True predicate) -> 'switch', the Identity of the live output.
+    #   'merge:1'(value_index)              -> 'merge/value_index', a Const of the live input index.
+    renamed = {}
+    new_nodes = []
+    for node in graph_def.node:
+        if node.name in switches and switches[node.name]:
+            renamed[node.name + ':1'] = node.name
+        if node.name in dead_nodes or node.op != 'Merge' or any([x.startswith('^') for x in node.input]): continue
+        live = [i for i, x in enumerate(node.input) if not is_dead(x)]
+        if len(live) != 1: continue
+        renamed[node.name + ':1'] = node.name + '/value_index'
+        new_nodes.append(_const_node(node.name + '/value_index', np.array(live[0], dtype=np.int32)))
+
+    output_graph_def = tf.GraphDef()
+    output_graph_def.versions.CopyFrom(graph_def.versions)
+    output_graph_def.library.CopyFrom(graph_def.library)
+    for node in graph_def.node:
+        if node.name in dead_nodes: continue
+        if node.name == is_train_name:
+            output_graph_def.node.extend([is_train])
+        elif node.name in switches:
+            output_graph_def.node.extend([_identity_node(node.name, node.input[0], node.attr['T'])])
+        elif node.op == 'Merge' and node.name + ':1' in renamed:
+            live = [x for x in node.input if not is_dead(x)]
+            output_graph_def.node.extend([_identity_node(node.name, live[0], node.attr['T'])])
+        else:
+            output_graph_def.node.extend([node])
+    output_graph_def.node.extend(new_nodes)
+    for node in output_graph_def.node:
+        inputs = [renamed.get(x, x) for x in node.input]
+        del node.input[:]
+        node.input.extend(inputs)
+    print('folded %d switches on %s, removed %d nodes in dead branches' % (len(switches), is_train_name, len(dead_nodes)))
+    return output_graph_def
+
+def strip_dropout(graph_def):
+    """Replace dropouts with keep_prob 1.0 by Identity.
+    dropout(x, keep_prob) = (x / keep_prob) * floor(keep_prob + random_uniform(shape)), see tf.nn.dropout().
+    """
+    nodes = dict([(node.name, node) for node in graph_def.node])
+    def const_value(name):
+        name = _input_name(name)
+        while name in nodes and nodes[name].op == 'Identity':
+            name = _input_name(nodes[name].input[0])
+        if name in nodes and nodes[name].op == 'Const':
+            return tf.make_ndarray(nodes[name].attr['value'].tensor)
+        return None
+    replaced = {}
+    for node in graph_def.node:
+        if node.op != 'Mul' or len(node.input) != 2: continue
+        div = nodes.get(_input_name(node.input[0]))
+        floor = nodes.get(_input_name(node.input[1]))
+        if div is None or floor is None: continue
+        if div.op not in ['RealDiv', 'Div'] or floor.op != 'Floor': continue
+        keep_prob = const_value(div.input[1])
+        if keep_prob is None or np.any(keep_prob != 1.0): continue
+        replaced[node.name] = _identity_node(node.name, div.input[0], node.attr['T'])
+    output_graph_def = tf.GraphDef()
+    output_graph_def.versions.CopyFrom(graph_def.versions)
+    output_graph_def.library.CopyFrom(graph_def.library)
+    for node in graph_def.node:
+        output_graph_def.node.extend([replaced.get(node.name, node)])
+    print('stripped %d dropouts' % len(replaced))
+    return output_graph_def
+
+def optimize_for_inference(graph_def, output_node_names):
+    """Specialize a frozen graph for inference.
+    fold is_train=False and the conds on it, strip identity dropouts,
+    then run graph transforms(constant folding, duplicate nodes merging, ...).
+
+    Returns:
+      optimized graph_def
+    """
+    from tensorflow.tools.graph_transforms import TransformGraph
+    outputs = output_node_names.split(',')
+    graph_def = fold_is_train(graph_def)
+    # keep probabilities are constants now.
+    inputs = [node.name for node in graph_def.node if node.op in ['Placeholder', 'PlaceholderWithDefault']]
+    graph_def = TransformGraph(graph_def, inputs, outputs, ['fold_constants(ignore_errors=true)'])
+    graph_def = strip_dropout(graph_def)
+    graph_def = tf.graph_util.extract_sub_graph(graph_def, outputs)
+    inputs = [node.name for node in graph_def.node if node.op in ['Placeholder', 'PlaceholderWithDefault']]
+    transforms = ['remove_nodes(op=Identity, op=CheckNumerics)',
+                  'fold_constants(ignore_errors=true)',
+                  'fold_batch_norms',
+                  'fold_old_batch_norms',
+                  'merge_duplicate_nodes',
+                  'strip_unused_nodes',
+                  'sort_by_execution_order']
+    return TransformGraph(graph_def, inputs, outputs, transforms)
+
+def token_f1(config, buckets, tags_list):
+    """Compute token-based micro f1 of predicted tags, same as TokenEval.
+    """
+    from token_eval import TokenEval
+    embvec = config.embvec
+    max_length = max([len(bucket) for bucket in buckets])
+    target = np.zeros([len(buckets), max_length], dtype=np.int32)
+    prediction = np.zeros([len(buckets), max_length], dtype=np.int32)
+    lengths = []
+    for i, (bucket, tags) in enumerate(zip(buckets, tags_list)):
+        for j, tag in enumerate(tags):
+            target[i, j] = embvec.get_tid(bucket[j].split()[3])
+            prediction[i, j] = embvec.get_tid(tag)
+        lengths.append(len(tags))
+    return TokenEval.compute_f1(config.class_size, prediction, target, lengths)[0]
+
+def evaluate_frozen_graphs(config, frozen_paths, test_path, batch_size=128):
+    """Report size, number of ops, load time, latency and token f1 of frozen graphs on test data.
+    the first graph is the baseline of f1 delta.
+    """
+    from predictor import Predictor
+    from pipeline import read_buckets
+    with open(test_path) as f:
+        buckets = list(read_buckets(f))
+    base_f1 = None
+    for path in frozen_paths:
+        start_time = time.time()
+        predictor = Predictor(config, path)
+        # the first run includes graph optimizations(ex, constant folding of dequantization).
+        predictor.predict(buckets[:1])
+        load_time = time.time() - start_time
+        num_ops = len(predictor.graph.get_operations())
+        # latency for a sentence at a time
+        start_time = time.time()
+        for bucket in buckets: predictor.predict([bucket])
+        latency = (time.time() - start_time) / len(buckets)
+        tags_list = predictor.tag(buckets, batch_size)
+        predictor.close()
+        f1 = token_f1(config, buckets, tags_list)
+        if base_f1 is None: base_f1 = f1
+        print('%s : size %.1f MB, %d ops, load time %.3f sec, latency %.2f ms/sentence, token f1 %.4f(%+.4f)' % \
+            (path, os.path.getsize(path) / float(1 << 20), num_ops, load_time, latency * 1000, f1, f1 - base_f1))
+
+def freeze_graph(model_dir, output_node_names, frozen_model_name, optimize_graph_def=0, compress='', compress_min_size=16384,
+                 optimize_inference=0):
     """Extract the sub graph defined by the output nodes and convert 
     all its variables into constant 
     Args:
@@ -40,6 +375,11 @@ def freeze_graph(model_dir, output_node_names, frozen_model_name, optimize_graph
                             comma separated
         frozen_model_name: a string, the name of the frozen model
         optimize_graph_def: int, 1 for optimizing graph_def via tensorRT
+        compress: '' | 'int8' | 'float16', if given, write a compressed frozen model(frozen_model_name.compress) as well
+        compress_min_size: minimum number of elements of a constant to be compressed
+        optimize_inference: int, 1 for writing a frozen model optimized for inference(frozen_model_name.optimized) as well
+    Returns:
+        list of paths to the frozen model(and the optimized, compressed one)
     """
     if not tf.gfile.Exists(model_dir):
         raise AssertionError(
@@ -76,8 +416,9 @@ def freeze_graph(model_dir, output_node_names, frozen_model_name, optimize_graph
             output_node_names.split(',') # The output node names are used to select the usefull nodes
         )
 
-        # Modify for 'float_ref'
+        # Modify for 'float_ref', 'PlaceholderWithDefault'
         output_graph_def = modify_op(output_graph_def)
+        output_graph_def = tf.graph_util.extract_sub_graph(output_graph_def, output_node_names.split(','))
 
         # Optimize graph_def via tensorRT
         if optimize_graph_def:
@@ -97,8 +438,30 @@ def freeze_graph(model_dir, output_node_names, frozen_model_name, optimize_graph
         with tf.gfile.GFile(output_graph_path, "wb") as f:
             f.write(output_graph_def.SerializeToString())
         print("%d ops in the final graph." % len(output_graph_def.node))
+        output_graph_paths = [output_graph_path]
 
-    return output_graph_def
+        # Optimize for inference
+        if optimize_inference:
+            num_ops = len(output_graph_def.node)
+            output_graph_def = optimize_for_inference(output_graph_def, output_node_names)
+            optimized_graph_path = output_graph_path + '.optimized'
+            with tf.gfile.GFile(optimized_graph_path, "wb") as f:
+                f.write(output_graph_def.SerializeToString())
+            print("%d ops -> %d ops in the optimized graph." % (num_ops, len(output_graph_def.node)))
+            output_graph_paths.append(optimized_graph_path)
+
+        # Compress large constants
+        if compress:
+            compressed_graph_def = compress_graph_def(output_graph_def, output_node_names, mode=compress, min_size=compress_min_size)
+            compressed_graph_path = output_graph_paths[-1] + '.' + compress
+            with tf.gfile.GFile(compressed_graph_path, "wb") as f:
+                f.write(compressed_graph_def.SerializeToString())
+            print("%d ops in the compressed graph, %.1f MB -> %.1f MB." % (len(compressed_graph_def.node),
+                  os.path.getsize(output_graph_paths[-1]) / float(1 << 20),
+                  os.path.getsize(compressed_graph_path) / float(1 << 20)))
+            output_graph_paths.append(compressed_graph_path)
+
+    return output_graph_paths
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -106,8 +469,25 @@ if __name__ == '__main__':
     parser.add_argument("--frozen_model_name", type=str, help="The name of the frozen model", required=True)
     parser.add_argument("--output_node_names", type=str, help="The name of the output nodes, comma separated.", required=True)
     parser.add_argument("--optimize_graph_def", type=int, help="1 for optimizing graph_def via tensorRT, default 0", default=0, required=False)
+    parser.add_argument("--optimize_inference", type=int, help="1 for writing a frozen model optimized for inference(is_train folded, dropout stripped), default 0", default=0, required=False)
+    parser.add_argument("--compress", type=str, help="int8 | float16, write a compressed frozen model as well", default='', required=False)
+    parser.add_argument("--compress_min_size", type=int, help="minimum number of elements of a constant to be compressed", default=16384, required=False)
+    # for evaluating frozen models(size, load time, token f1) on test data
+    parser.add_argument("--test_path", type=str, help="path to test data(ex, ../data/test.txt)", default='', required=False)
+    parser.add_argument('--emb_path', type=str, help='path to word embedding vector + vocab(.pkl), for --test_path', default='', required=False)
+    parser.add_argument('--wrd_dim', type=int, help='dimension of word embedding vector, for --test_path', default=100, required=False)
+    parser.add_argument('--word_length', type=int, default=15, help='max word length, for --test_path')
+    parser.add_argument('--emb_class', type=str, default='glove', help='class of embedding(glove, elmo, bert, bert+elmo), for --test_path')
     args = parser.parse_args()
 
-    freeze_graph(args.model_dir, args.output_node_names, args.frozen_model_name, args.optimize_graph_def)
+    output_graph_paths = freeze_graph(args.model_dir, args.output_node_names, args.frozen_model_name, args.optimize_graph_def,
+                                      compress=args.compress, compress_min_size=args.compress_min_size,
+                                      optimize_inference=args.optimize_inference)
+
+    if args.test_path:
+        from config import Config
+        args.restore = None
+        config = Config(args, is_training=False, emb_class=args.emb_class, use_crf=True)
+        evaluate_frozen_graphs(config, output_graph_paths, args.test_path)
 
     
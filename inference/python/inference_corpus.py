@@ -0,0 +1,180 @@
+from __future__ import print_function
+import sys
+import os
+path = os.path.dirname(os.path.abspath(__file__)) + '/../..'
+sys.path.append(path)
+import time
+import argparse
+import mmap
+import multiprocessing
+# tensorflow is imported in worker processes only(see _init_worker()).
+# see : https://github.com/tensorflow/tensorflow/issues/5448
+
+from embvec import EmbVec
+from config import Config
+
+# set by tag_corpus() before forking workers, shared by workers without pickling.
+_corpus = {}
+# per worker process, Predictor and opened input file.
+_worker = {}
+
+def split_shards(mm, shard_size):
+    """Split a CoNLL file into byte ranges on blank line(sentence) boundaries.
+    a blank line may have white spaces or '\r'(CRLF line endings).
+
+    Args:
+      mm: mmap of the input file.
+      shard_size: approximate number of bytes per shard.
+    Returns:
+      list of (begin, end)
+    """
+    shards = []
+    size = len(mm)
+    begin = 0
+    while begin < size:
+        end = min(begin + shard_size, size)
+        if end < size:
+            # end of the line at end - 1, then advance to the end of the next blank line.
+            pos = mm.find(b'\n', end - 1)
+            end = size
+            while 0 <= pos < size - 1:
+                next_pos = mm.find(b'\n', pos + 1)
+                if next_pos < 0: break
+                if not mm[pos+1:next_pos].strip():
+                    end = next_pos + 1
+                    break
+                pos = next_pos
+        shards.append((begin, end))
+        begin = end
+    return shards
+
+def read_buckets(text):
+    """Read buckets(sentences separated by blank lines) from CoNLL text.
+    """
+    buckets = []
+    bucket = []
+    for line in text.split('\n'):
+        line = line.strip()
+        if line:
+            bucket.append(line)
+            continue
+        if bucket: buckets.append(bucket)
+        bucket = []
+    if bucket: buckets.append(bucket)
+    return buckets
+
+def _init_worker(counter):
+    import tensorflow as tf
+    # for LSTMBlockFusedCell(), https://github.com/tensorflow/tensorflow/issues/23369
+    tf.contrib.rnn
+    # for QRNN
+    try: import qrnn
+    except: sys.stderr.write('import qrnn, failed\n')
+    from predictor import Predictor
+
+    intra_op_threads = _corpus['intra_op_threads']
+    with counter.get_lock():
+        worker_index = counter.value
+        counter.value += 1
+    # pin each worker to its own cores so that workers do not oversubscribe.
+    if hasattr(os, 'sched_setaffinity'):
+        num_cpus = multiprocessing.cpu_count()
+        cpus = set([(worker_index * intra_op_threads + i) % num_cpus for i in range(intra_op_threads)])
+        os.sched_setaffinity(0, cpus)
+    session_conf = tf.ConfigProto(allow_soft_placement=True,
+                                  log_device_placement=False,
+                                  gpu_options=tf.GPUOptions(),
+                                  inter_op_parallelism_threads=1,
+                                  intra_op_parallelism_threads=intra_op_threads)
+    _worker['predictor'] = Predictor(_corpus['config'], _corpus['frozen_path'], session_conf=session_conf)
+    f = open(_corpus['input_path'], 'rb')
+    _worker['mm'] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _worker['file'] = f
+
+def _tag_shard(shard):
+    """Tag a shard.
+
+    Args:
+      shard: (begin, end) byte range of the input file.
+    Returns:
+      tagged text(utf-8), number of sentences, number of bytes.
+    """
+    begin, end = shard
+    text = _worker['mm'][begin:end].decode('utf-8')
+    buckets = read_buckets(text)
+    tags_list = _worker['predictor'].tag(buckets, _corpus['batch_size'])
+    out = []
+    for bucket, tags in zip(buckets, tags_list):
+        for i in range(len(bucket)):
+            out.append(bucket[i] + ' ' + tags[i] + '\n')
+        out.append('\n')
+    return ''.join(out).encode('utf-8'), len(buckets), end - begin
+
+def tag_corpus(config, args):
+    """Tag a CoNLL file by worker processes, each with a frozen graph, and merge outputs in order.
+    """
+    num_workers = args.num_workers
+    if num_workers <= 0: num_workers = max(1, multiprocessing.cpu_count() // args.intra_op_threads)
+    f = open(args.input_path, 'rb')
+    size = os.fstat(f.fileno()).st_size
+    if size == 0:
+        open(args.output_path, 'wb').close()
+        return
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    shards = split_shards(mm, args.shard_size)
+    mm.close()
+    f.close()
+    sys.stderr.write('%s bytes, %s shards, %s workers x %s intra op threads\n' % (size, len(shards), num_workers, args.intra_op_threads))
+    if len(shards) == 1 and size > args.shard_size:
+        sys.stderr.write('[warning] no sentence boundary(blank line) is found, %s is tagged by a single worker\n' % (args.input_path))
+
+    global _corpus
+    _corpus = {'config': config,
+               'frozen_path': args.frozen_path,
+               'input_path': args.input_path,
+               'batch_size': args.batch_size,
+               'intra_op_threads': args.intra_op_threads}
+    counter = multiprocessing.Value('i', 0)
+    # workers are forked, so they share config(embvec, ...) without pickling.
+    pool = multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=(counter,))
+    start_time = time.time()
+    num_sentences = 0
+    num_bytes = 0
+    with open(args.output_path, 'wb') as out:
+        # imap() returns results in the order of shards.
+        for idx, (text, n, nbytes) in enumerate(pool.imap(_tag_shard, shards)):
+            out.write(text)
+            num_sentences += n
+            num_bytes += nbytes
+            duration_time = time.time() - start_time
+            sys.stderr.write('[%s/%s] %.1f%%, %s sentences, %.1f sentences/sec, %.2f MB/sec\n' % \
+                (idx+1, len(shards), 100.0 * num_bytes / size, num_sentences,
+                 num_sentences / duration_time, num_bytes / duration_time / (1 << 20)))
+    pool.close()
+    pool.join()
+    _corpus = {}
+
+    duration_time = time.time() - start_time
+    out = 'total_duration_time : ' + str(duration_time) + ' sec' + '\n'
+    out += 'number of sentences : ' + str(num_sentences) + '\n'
+    out += 'sentences/sec : ' + str(num_sentences / duration_time)
+    sys.stderr.write(out + '\n')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--emb_path', type=str, help='path to word embedding vector + vocab(.pkl)', required=True)
+    parser.add_argument('--wrd_dim', type=int, help='dimension of word embedding vector', required=True)
+    parser.add_argument('--word_length', type=int, default=15, help='max word length')
+    parser.add_argument('--frozen_path', type=str, help='path to frozen model(ex, ./exported/ner_frozen.pb)', required=True)
+    parser.add_argument('--input_path', type=str, help='path to input CoNLL file(sentences separated by blank lines)', required=True)
+    parser.add_argument('--output_path', type=str, help='path to output file', required=True)
+    parser.add_argument('--num_workers', type=int, default=0, help='number of worker processes, 0 for cpu count / intra_op_threads')
+    parser.add_argument('--intra_op_threads', type=int, default=1, help='number of intra op threads per worker')
+    parser.add_argument('--batch_size', type=int, default=128, help='number of sentences per batch')
+    parser.add_argument('--shard_size', type=int, default=1 << 20, help='approximate number of bytes per shard')
+
+    args = parser.parse_args()
+
+    args.restore = None
+    config = Config(args, is_training=False, emb_class='glove', use_crf=True)
+    tag_corpus(config, args)
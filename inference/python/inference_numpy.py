@@ -0,0 +1,97 @@
+from __future__ import print_function
+import sys
+import os
+path = os.path.dirname(os.path.abspath(__file__)) + '/../..'
+sys.path.append(path)
+import time
+import argparse
+# no tensorflow import here, except for verify mode.
+
+from embvec import EmbVec
+from config import Config
+from numpy_model import NumpyModel
+from pipeline import read_buckets
+
+def inference(config, args):
+    """Inference for buckets from stdin by NumpyModel.
+    """
+    start_time = time.time()
+    model = NumpyModel(config, args.npz_path)
+    sys.stderr.write('model loaded, %s sec\n' % (time.time() - start_time))
+
+    num_sentences = 0
+    start_time = time.time()
+    chunk = []
+    def flush(chunk):
+        tags_list = model.tag(chunk, args.batch_size)
+        for bucket, tags in zip(chunk, tags_list):
+            for i in range(len(bucket)):
+                sys.stdout.write(bucket[i] + ' ' + tags[i] + '\n')
+            sys.stdout.write('\n')
+        return len(chunk)
+    for bucket in read_buckets(sys.stdin):
+        chunk.append(bucket)
+        if len(chunk) == args.batch_size:
+            num_sentences += flush(chunk)
+            chunk = []
+    if chunk: num_sentences += flush(chunk)
+    duration_time = time.time() - start_time
+
+    out = 'total_duration_time : ' + str(duration_time) + ' sec' + '\n'
+    out += 'number of sentences : ' + str(num_sentences) + '\n'
+    out += 'sentences/sec : ' + str(num_sentences / max(duration_time, 1e-9))
+    sys.stderr.write(out + '\n')
+
+def verify(config, args):
+    """Compare tags of NumpyModel with those of the frozen graph.
+    """
+    with open(args.input_path) as f:
+        buckets = list(read_buckets(f))
+
+    model = NumpyModel(config, args.npz_path)
+    start_time = time.time()
+    np_tags_list = model.tag(buckets, args.batch_size)
+    np_duration_time = time.time() - start_time
+
+    from predictor import Predictor
+    predictor = Predictor(config, args.frozen_path)
+    start_time = time.time()
+    tf_tags_list = predictor.tag(buckets, args.batch_size)
+    tf_duration_time = time.time() - start_time
+    predictor.close()
+
+    num_tokens = 0
+    num_diff_tokens = 0
+    num_diff_sentences = 0
+    for bucket, np_tags, tf_tags in zip(buckets, np_tags_list, tf_tags_list):
+        num_tokens += len(tf_tags)
+        diff = len([1 for a, b in zip(np_tags, tf_tags) if a != b]) + abs(len(np_tags) - len(tf_tags))
+        num_diff_tokens += diff
+        if diff:
+            num_diff_sentences += 1
+            if num_diff_sentences <= 10:
+                sys.stderr.write('[diff] %s\n  numpy : %s\n  tf    : %s\n' % \
+                    (' '.join([line.split()[0] for line in bucket]), ' '.join(np_tags), ' '.join(tf_tags)))
+    out = 'sentences : ' + str(len(buckets)) + ', tokens : ' + str(num_tokens) + '\n'
+    out += 'different sentences : ' + str(num_diff_sentences) + ', different tokens : ' + str(num_diff_tokens) + '\n'
+    out += 'numpy : ' + str(np_duration_time) + ' sec, tf : ' + str(tf_duration_time) + ' sec'
+    sys.stderr.write(out + '\n')
+    if num_diff_tokens != 0: sys.exit(1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--emb_path', type=str, help='path to word embedding vector + vocab(.pkl)', required=True)
+    parser.add_argument('--wrd_dim', type=int, help='dimension of word embedding vector', required=True)
+    parser.add_argument('--word_length', type=int, default=15, help='max word length')
+    parser.add_argument('--npz_path', type=str, help='path to exported weights(ex, ./exported/ner_model.npz)', required=True)
+    parser.add_argument('--mode', type=str, default='tag', help='tag, verify')
+    parser.add_argument('--frozen_path', type=str, default='', help='path to frozen model for verify mode(ex, ./exported/ner_frozen.pb)')
+    parser.add_argument('--input_path', type=str, default='', help='path to CoNLL file for verify mode(ex, ../data/test.txt)')
+    parser.add_argument('--batch_size', type=int, default=128, help='number of sentences per batch')
+
+    args = parser.parse_args()
+
+    args.restore = None
+    config = Config(args, is_training=False, emb_class='glove', use_crf=True)
+    if args.mode == 'tag': inference(config, args)
+    if args.mode == 'verify': verify(config, args)
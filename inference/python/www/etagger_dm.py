@@ -24,12 +24,14 @@ path = os.path.dirname(os.path.abspath(__file__)) + '/lib'
 sys.path.append(path)
 from embvec import EmbVec
 from config import Config
+from featurizer import Featurizer, BufferArena
 # etagger arguments
 define('emb_path', default='', help='path to word embedding vector + vocab(.pkl)', type=str)
 define('emb_class', default='glove', help='class of embedding(glove, elmo, bert, bert+elmo)', type=str)
 define('wrd_dim', default=100, help='dimension of word embedding vector', type=int)
 define('word_length', default=15, help='max word length', type=int)
 define('frozen_path', default='', help='path to frozen graph', type=str)
+define('form_table_path', default='', help='path to form table for the frozen graph with word form cache', type=str)
 define('restore', default='', help='dummy path for config', type=str)
 ###############################################################################################
 
@@ -94,6 +96,7 @@ class Application(tornado.web.Application):
         ###############################################################################################
         # create etagger config only once
         self.config = Config(options, is_training=False, emb_class=options.emb_class, use_crf=True)
+        if options.form_table_path: self.config.load_form_table(options.form_table_path)
         self.log.info('initialize config on parent process[%s] ... done' % (ppid))
         # create nlp(spacy) only once
         self.nlp = spacy.load('en')
@@ -118,44 +121,30 @@ class Application(tornado.web.Application):
         self.log.info('initialize per child process[%s] ...' % (pid))
         ###############################################################################################
         # loading frozen model for each child process.
+        # predictor resolves tensors and compiles a callable once, featurizer with reusable input buffers.
+        from predictor import Predictor
         self.etagger = {}
-        graph = self.load_frozen_graph(tf, options.frozen_path)
         gpu_ops = tf.GPUOptions()
         session_conf = tf.ConfigProto(allow_soft_placement=True,
                                       log_device_placement=False,
                                       gpu_options=gpu_ops,
                                       inter_op_parallelism_threads=0,
                                       intra_op_parallelism_threads=0)
-        sess = tf.Session(graph=graph, config=session_conf)
+        featurizer = Featurizer(self.config, arena=BufferArena())
+        predictor = Predictor(self.config, options.frozen_path, featurizer=featurizer, session_conf=session_conf)
         m = {}
-        m['sess'] = sess
-        m['graph'] = graph
+        m['predictor'] = predictor
         self.etagger[pid] = m
         ###############################################################################################
         self.log.info('initialize per child process[%s] ... done' % (pid))
 
-    def load_frozen_graph(self, tf, frozen_graph_filename, prefix='prefix'):
-        with tf.gfile.GFile(frozen_graph_filename, "rb") as f:
-            graph_def = tf.GraphDef()
-            graph_def.ParseFromString(f.read())
-        with tf.Graph().as_default() as graph:
-            tf.import_graph_def(
-                graph_def, 
-                input_map=None, 
-                return_elements=None, 
-                op_dict=None, 
-                producer_op_list=None,
-                name=prefix,
-            )
-        return graph
-
     def finalize(self):
         # finalize resources
         self.log.info('finalize resources...')
         ## finalize something....
         for pid, m in self.etagger.items() :
-            sess = m['sess']
-            sess.close()
+            predictor = m['predictor']
+            predictor.close()
         
         log.info('Close logger...')
         x = list(log.handlers)
@@ -11,11 +11,7 @@ import time
 # etagger
 path = os.path.dirname(os.path.abspath(__file__)) + '/lib'
 sys.path.append(path)
-# although `import tensorflow as tf statement is in the `input.py`,
-# this statement will not be called by 
-# `from handlers.index import IndexHandler, HCheckHandler, EtaggerHandler, EtaggerTestHandler`.
-from input import Input
-import feed
+# tensorflow is imported in child processes only(see etagger_dm.py), predictor is created there.
 
 def get_entity(doc, begin, end):
     for ent in doc.ents:
@@ -41,25 +37,12 @@ def build_bucket(nlp, line):
         bucket.append(temp)
     return bucket
 
-def analyze(graph, sess, query, config, nlp):
+def analyze(predictor, query, config, nlp):
     """Analyze query by nlp, etagger
     """
     bucket = build_bucket(nlp, query)
-    inp, feed_dict = feed.build_input_feed_dict_with_graph(graph, config, bucket, Input)
-    ## mapping output/input tensors for bert
-    if 'bert' in config.emb_class:
-        t_bert_embeddings_subgraph = graph.get_tensor_by_name('prefix/bert_embeddings_subgraph:0')
-        p_bert_embeddings = graph.get_tensor_by_name('prefix/bert_embeddings:0')
-    ## mapping output tensors
-    t_logits_indices = graph.get_tensor_by_name('prefix/logits_indices:0')
-    t_sentence_lengths = graph.get_tensor_by_name('prefix/sentence_lengths:0')
     ## analyze
-    if 'bert' in config.emb_class:
-        # compute bert embedding at runtime
-        bert_embeddings = sess.run([t_bert_embeddings_subgraph], feed_dict=feed_dict)
-        # update feed_dict
-        feed_dict[p_bert_embeddings] = feed.align_bert_embeddings(config, bert_embeddings, inp.example['bert_wordidx2tokenidx'], -1)
-    logits_indices, sentence_lengths = sess.run([t_logits_indices, t_sentence_lengths], feed_dict=feed_dict)
+    logits_indices, sentence_lengths = predictor.predict([bucket])
     tags = config.logit_indices_to_tags(logits_indices[0], sentence_lengths[0])
     ## build output
     out = []
@@ -120,11 +103,10 @@ class EtaggerHandler(BaseHandler):
 
         config = self.config
         m = self.etagger[pid]
-        sess = m['sess']
-        graph = m['graph']
+        predictor = m['predictor']
         nlp = self.nlp
         try :
-            out = analyze(graph, sess, query, config, nlp)
+            out = analyze(predictor, query, config, nlp)
             rst['status'] = 200
             rst['output'] = out
         except :
@@ -181,8 +163,7 @@ class EtaggerTestHandler(BaseHandler):
         pid = os.getpid()
         config = self.config
         m = self.etagger[pid]
-        sess = m['sess']
-        graph = m['graph']
+        predictor = m['predictor']
         nlp = self.nlp
 
         if is_json_request : lines = content
@@ -192,7 +173,7 @@ class EtaggerTestHandler(BaseHandler):
             for line in lines :
                 line = line.strip()
                 if not line : continue
-                out = analyze(graph, sess, line, config, nlp)
+                out = analyze(predictor, line, config, nlp)
                 out_list.append(out)
             self.write(dict(success=True, record=out_list, info=None))
         except Exception as e:
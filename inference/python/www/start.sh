@@ -140,6 +140,10 @@ function copy_resources {
     cp -rf ${PPPDIR}/config.py ${CDIR}/lib
     cp -rf ${PPPDIR}/input.py  ${CDIR}/lib
     cp -rf ${PPPDIR}/feed.py   ${CDIR}/lib
+    cp -rf ${PPPDIR}/featurizer.py ${CDIR}/lib
+    cp -rf ${PPPDIR}/predictor.py  ${CDIR}/lib
+    cp -rf ${PPPDIR}/wordpiece.py  ${CDIR}/lib
+    cp -rf ${PPPDIR}/elmo_chars.py ${CDIR}/lib
     # for bert
     case "${EMB_CLASS}" in
         *bert*)
@@ -1,10 +1,35 @@
 from __future__ import print_function
 import sys
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+import multiprocessing
 import tensorflow as tf
 import numpy as np
 from embvec import EmbVec
 import collections
 
+# version of tfrecords layout, bump it when features are changed.
+TFRECORDS_VERSION = 3
+
+# Input of a worker process, set once by _init_tfrecords_worker() in every worker of the pool.
+_worker_input = None
+
+def _init_tfrecords_worker(inp):
+    global _worker_input
+    _worker_input = inp
+
+def _create_tfrecords_shard(task):
+    """Create a tfrecords shard in a worker process.
+
+    Args:
+      task: (shard_file, buckets, ex_offset), see Input.create_tfrecords_shard().
+    """
+    shard_file, buckets, ex_offset = task
+    return _worker_input.create_tfrecords_shard(shard_file, buckets, ex_offset)
+
 class Input:
 
     def __init__(self, data, config, build_output=True, do_shuffle=False, reuse=False):
@@ -15,7 +40,8 @@ class Input:
           config: an instance of Config.
           build_output: if True, build output 'tags' feature.
           do_shuffle: if True, shuffle training data(tfrecords).
-          reuse: if True, reuse the tfrecords file which was built previously.
+          reuse: if True, reuse the cached tfrecords which were built previously
+                 from the same data file and settings(content-addressed).
         """
         self.config = config
         self.build_output = build_output
@@ -23,32 +49,82 @@ class Input:
         if type(data) is list: # treat data as bucket.
             # compute max sentence length
             self.max_sentence_length = len(data)
-            # trick for reusing codes.
             if 'bert' in self.config.emb_class:
-                self.max_sentence_length = self.config.bert_max_seq_length
+                self.max_sentence_length = min(self.max_sentence_length, self.config.bert_max_seq_length)
             self.num_examples = 1
             self.num_batches = 1
             # for inference, use example directly.
             self.example = None
+            self.bert_feature_store = None
+            self.elmo_feature_store = None
             # create tf records
             self.__create_tfrecords(data)
         else:                  # treat as file path.
+            # content-addressed cache of tfrecords(shards and manifest).
+            self.cache_dir = os.path.join(data + '.cache', self.__cache_key(data))
+            self.manifest_file = os.path.join(self.cache_dir, 'manifest.json')
+            manifest = None
+            if reuse: manifest = self.__load_manifest()
             # compute max sentence length, number of examples, number of batches.
-            self.max_sentence_length, self.num_examples = self.stat(data)
-            # trick for reusing codes.
+            if manifest:
+                tf.logging.info('reuse cached tfrecords in %s' % (self.cache_dir))
+                self.max_sentence_length = manifest['max_sentence_length']
+                self.num_examples = manifest['num_examples']
+                length_counts = dict([(int(l), c) for l, c in manifest['length_counts'].items()])
+            else:
+                self.max_sentence_length, self.num_examples, length_counts = self.stat(data)
+                stat = (self.max_sentence_length, self.num_examples, length_counts)
+            # length-bucketed batching by the number of tokens, 0 for fixed batch_size.
+            self.batch_token_size = config.batch_token_size
+            # word pieces of a sentence are truncated by bert_max_seq_length.
             if 'bert' in self.config.emb_class:
-                self.max_sentence_length = self.config.bert_max_seq_length
-            self.num_batches = (self.num_examples + config.batch_size - 1) // config.batch_size 
-            # create tf records
-            # if reuse is True, do not create tfrecords again.
-            self.tfrecords_file = data + '.tfrecords'
-            if not reuse: self.__create_tfrecords(data)
+                self.max_sentence_length = min(self.max_sentence_length, self.config.bert_max_seq_length)
+            if self.batch_token_size > 0:
+                self.bucket_boundaries, self.bucket_batch_sizes = self.__bucketing(self.batch_token_size)
+                self.num_batches = self.__compute_num_batches(length_counts)
+            else:
+                self.num_batches = (self.num_examples + config.batch_size - 1) // config.batch_size 
+            # create tf records(shards) and manifest if there is no valid cache.
+            if not manifest:
+                manifest = self.__create_cache(data, stat)
+            dirname = os.path.dirname(self.manifest_file)
+            self.tfrecords_files = [os.path.join(dirname, shard) for shard in manifest['shards']]
             # create dataset
             self.keys_to_features = self.__keys_to_features()
             self.dataset = self.__dataset_input_fn(config.batch_size, do_shuffle)
+            # precomputed bert embeddings, biLM layer activations(FeatureStore) keyed by 'ex_index', see train.py.
+            self.bert_feature_store = None
+            self.elmo_feature_store = None
  
-    def __create_tfrecords(self, data):
+    def __create_cache(self, data, stat):
+        """Create tfrecords shards and manifest in a temporary directory
+        and rename it to cache_dir, so that a failed build never leaves partial shards in cache_dir.
+
+        Returns:
+          manifest.
+        """
+        parent_dir = os.path.dirname(self.cache_dir)
+        if not os.path.exists(parent_dir): os.makedirs(parent_dir)
+        tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(self.cache_dir) + '.tmp-', dir=parent_dir)
+        try:
+            shards = self.__create_tfrecords(data, tfrecords_prefix=os.path.join(tmp_dir, 'tfrecords'))
+            manifest = self.__write_manifest(shards, stat, os.path.join(tmp_dir, 'manifest.json'))
+            # stale cache(no valid manifest or reuse=False) is replaced.
+            if os.path.exists(self.cache_dir): shutil.rmtree(self.cache_dir)
+            os.rename(tmp_dir, self.cache_dir)
+        except:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return manifest
+
+    def __create_tfrecords(self, data, tfrecords_prefix=None):
         """Create input tfrecords.
+
+        Args:
+          data: a bucket or a file path.
+          tfrecords_prefix: path prefix of tfrecords shards, if data is a file path.
+        Returns:
+          list of (shard file, number of examples) if data is a file path.
         """
 
         if type(data) is list: # treat data as bucket.
@@ -58,89 +134,282 @@ class Input:
             self.example = example 
         else:                  # treat data as file path.
             path = data
-            writer = tf.python_io.TFRecordWriter(self.tfrecords_file)
-            bucket = []
-            ex_index = 0
-            for line in open(path):
-                if line in ['\n', '\r\n']:
-                    tf_example, example = self.__create_single_tf_example(bucket, ex_index)
-                    writer.write(tf_example.SerializeToString())
-                    if ex_index % 500 == 0:
-                        tf.logging.info("writing example %d" % (ex_index))
-                    bucket = []
-                    ex_index += 1
-                else:
-                    bucket.append(line)
-            writer.close()
+            buckets = self.__read_buckets(path)
+            # split buckets into shards and featurize them in a process pool.
+            num_workers = self.config.num_preprocess_workers
+            if num_workers <= 0: num_workers = multiprocessing.cpu_count()
+            shard_size = (len(buckets) + num_workers - 1) // num_workers
+            shard_size = max(1, shard_size)
+            num_shards = max(1, (len(buckets) + shard_size - 1) // shard_size)
+            tasks = []
+            for i in range(num_shards):
+                shard_file = '%s-%05d-of-%05d.gz' % (tfrecords_prefix, i, num_shards)
+                begin = i * shard_size
+                tasks.append((shard_file, buckets[begin:begin+shard_size], begin))
+            if num_shards == 1:
+                return [self.create_tfrecords_shard(*tasks[0])]
+            # this Input(config, embvec, tokenizer, ...) is passed once to each worker, not with every task.
+            pool = multiprocessing.Pool(num_shards, initializer=_init_tfrecords_worker, initargs=(self,))
+            try:
+                results = pool.map(_create_tfrecords_shard, tasks)
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+            return results
+
+    def create_tfrecords_shard(self, shard_file, buckets, ex_offset):
+        """Create a tfrecords shard.
+
+        Args:
+          shard_file: path to tfrecords shard.
+          buckets: list of bucket.
+          ex_offset: example index of the first bucket.
+        Returns:
+          shard_file, number of examples.
+        """
+        options = tf.python_io.TFRecordOptions(tf.python_io.TFRecordCompressionType.GZIP)
+        writer = tf.python_io.TFRecordWriter(shard_file, options=options)
+        for i, bucket in enumerate(buckets):
+            ex_index = ex_offset + i
+            tf_example, example = self.__create_single_tf_example(bucket, ex_index)
+            writer.write(tf_example.SerializeToString())
+            if ex_index % 500 == 0:
+                tf.logging.info("writing example %d" % (ex_index))
+        writer.close()
+        return shard_file, len(buckets)
+
+    def __cache_key(self, data):
+        """Compute a hash of data file and every setting which affects tfrecords.
+        """
+        config = self.config
+        embvec = config.embvec
+        h = hashlib.sha1()
+        h.update(self.file_digest(data).encode('utf-8'))
+        settings = collections.OrderedDict()
+        settings['version'] = TFRECORDS_VERSION
+        settings['emb_class'] = config.emb_class
+        settings['word_length'] = config.word_length
+        settings['build_output'] = self.build_output
+        settings['lowercase'] = embvec.lowercase
+        if 'bert' in config.emb_class:
+            settings['bert_max_seq_length'] = config.bert_max_seq_length
+            settings['bert_do_lower_case'] = embvec.bert_do_lower_case
+            settings['bert_vocab'] = self.file_digest(embvec.bert_vocab_path)
+        h.update(json.dumps(settings).encode('utf-8'))
+        for vocab in [embvec.wrd_vocab, embvec.chr_vocab, embvec.pos_vocab, embvec.chk_vocab, embvec.tag_vocab]:
+            h.update(json.dumps(sorted(vocab.items())).encode('utf-8'))
+        return h.hexdigest()
+
+    @staticmethod
+    def file_digest(file_name):
+        """Compute sha1 digest of a file.
+        """
+        h = hashlib.sha1()
+        with open(file_name, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def __write_manifest(self, shards, stat, manifest_file):
+        """Write manifest of tfrecords shards and stat() results.
+        manifest is written last, after every shard is written.
+        """
+        max_sentence_length, num_examples, length_counts = stat
+        manifest = collections.OrderedDict()
+        manifest['version'] = TFRECORDS_VERSION
+        manifest['max_sentence_length'] = max_sentence_length
+        manifest['num_examples'] = num_examples
+        manifest['length_counts'] = dict([(str(l), c) for l, c in length_counts.items()])
+        manifest['shards'] = [os.path.basename(shard_file) for shard_file, _ in shards]
+        manifest['shard_num_examples'] = [n for _, n in shards]
+        with open(manifest_file, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+    def __load_manifest(self):
+        """Load manifest of tfrecords shards.
+
+        Returns:
+          manifest, None if there is no valid cache.
+        """
+        if not os.path.exists(self.manifest_file): return None
+        with open(self.manifest_file) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != TFRECORDS_VERSION: return None
+        dirname = os.path.dirname(self.manifest_file)
+        for shard in manifest['shards']:
+            if not os.path.exists(os.path.join(dirname, shard)): return None
+        return manifest
+
+    @staticmethod
+    def __read_buckets(file_name):
+        """Read buckets split on sentence boundaries.
+        """
+        buckets = []
+        bucket = []
+        for line in open(file_name):
+            if line in ['\n', '\r\n']:
+                buckets.append(bucket)
+                bucket = []
+            else:
+                bucket.append(line)
+        return buckets
 
     def __keys_to_features(self):
         """Create keys to features map.
+        every feature is stored without padding(ragged).
         """
         keys_to_features = {}
-        seq_length = self.max_sentence_length
-        word_length = self.config.word_length
-        class_size = self.config.class_size
+        keys_to_features['ex_index'] = tf.FixedLenFeature([], tf.int64)
+        keys_to_features['word_ids'] = tf.VarLenFeature(tf.int64)
+        keys_to_features['wordchr_ids'] = tf.VarLenFeature(tf.int64)
+        keys_to_features['pos_ids'] = tf.VarLenFeature(tf.int64)
+        keys_to_features['chk_ids'] = tf.VarLenFeature(tf.int64)
         if 'bert' in self.config.emb_class:
-            keys_to_features['word_ids'] = tf.FixedLenFeature([seq_length], tf.int64)
-            keys_to_features['wordchr_ids'] = tf.FixedLenFeature([seq_length*word_length], tf.int64)
-            keys_to_features['pos_ids'] = tf.FixedLenFeature([seq_length], tf.int64)
-            keys_to_features['chk_ids'] = tf.FixedLenFeature([seq_length], tf.int64)
-            keys_to_features['bert_token_ids'] = tf.FixedLenFeature([seq_length], tf.int64)
-            keys_to_features['bert_token_masks'] = tf.FixedLenFeature([seq_length], tf.int64)
-            keys_to_features['bert_segment_ids'] = tf.FixedLenFeature([seq_length], tf.int64)
-            keys_to_features['bert_wordidx2tokenidx'] = tf.FixedLenFeature([seq_length], tf.int64)
-            if 'elmo' in self.config.emb_class:
-                keys_to_features['elmo_wordchr_ids'] = tf.FixedLenFeature([(seq_length+2)*word_length], tf.int64)
-            if self.build_output:
-                keys_to_features['tags'] = tf.FixedLenFeature([seq_length*class_size], tf.int64)
-        else:
-            keys_to_features['word_ids'] = tf.FixedLenFeature([seq_length], tf.int64)
-            keys_to_features['wordchr_ids'] = tf.FixedLenFeature([seq_length*word_length], tf.int64)
-            keys_to_features['pos_ids'] = tf.FixedLenFeature([seq_length], tf.int64)
-            keys_to_features['chk_ids'] = tf.FixedLenFeature([seq_length], tf.int64)
-            if 'elmo' in self.config.emb_class:
-                keys_to_features['elmo_wordchr_ids'] = tf.FixedLenFeature([(seq_length+2)*word_length], tf.int64)
-            if self.build_output:
-                keys_to_features['tags'] = tf.FixedLenFeature([seq_length*class_size], tf.int64)
+            keys_to_features['bert_token_ids'] = tf.VarLenFeature(tf.int64)
+            keys_to_features['bert_token_masks'] = tf.VarLenFeature(tf.int64)
+            keys_to_features['bert_segment_ids'] = tf.VarLenFeature(tf.int64)
+            keys_to_features['bert_wordidx2tokenidx'] = tf.VarLenFeature(tf.int64)
+        if 'elmo' in self.config.emb_class:
+            keys_to_features['elmo_wordchr_ids'] = tf.VarLenFeature(tf.int64)
+        if self.build_output:
+            keys_to_features['tags'] = tf.VarLenFeature(tf.int64)
         return keys_to_features
 
+    def __padded_shapes(self):
+        """Create padded shapes map for batching.
+        'None' pads to the longest one in a batch,
+        word-level and word piece-level(bert) tensors are trimmed to their own longest length.
+        """
+        seq_length = None
+        elmo_seq_length = None
+        word_length = self.config.word_length
+        padded_shapes = {}
+        padded_shapes['ex_index'] = []
+        padded_shapes['word_ids'] = [seq_length]
+        padded_shapes['wordchr_ids'] = [seq_length, word_length]
+        padded_shapes['pos_ids'] = [seq_length]
+        padded_shapes['chk_ids'] = [seq_length]
+        if 'bert' in self.config.emb_class:
+            padded_shapes['bert_token_ids'] = [seq_length]
+            padded_shapes['bert_token_masks'] = [seq_length]
+            padded_shapes['bert_segment_ids'] = [seq_length]
+            padded_shapes['bert_wordidx2tokenidx'] = [seq_length]
+        if 'elmo' in self.config.emb_class:
+            padded_shapes['elmo_wordchr_ids'] = [elmo_seq_length, word_length] # '+2' stands for '<S>, </S>'
+        if self.build_output:
+            padded_shapes['tags'] = [seq_length]
+        return padded_shapes
+
+    def __bucketing(self, batch_token_size):
+        """Compute bucket boundaries and batch size of each bucket.
+
+        Args:
+          batch_token_size: maximum number of tokens in a batch.
+        Returns:
+          bucket boundaries, a bucket i holds lengths in [boundaries[i-1], boundaries[i]).
+          batch sizes for each bucket, len(boundaries) + 1.
+        """
+        width = self.config.bucket_width
+        boundaries = [b for b in range(width + 1, self.max_sentence_length + 1, width)]
+        max_lengths = [b - 1 for b in boundaries] + [self.max_sentence_length]
+        batch_sizes = [max(1, batch_token_size // max(1, l)) for l in max_lengths]
+        return boundaries, batch_sizes
+
+    def __compute_num_batches(self, length_counts):
+        """Compute the number of batches after length-bucketing.
+
+        Args:
+          length_counts: dict, sentence length -> number of examples.
+        """
+        import bisect
+        bucket_counts = [0] * len(self.bucket_batch_sizes)
+        for length, count in length_counts.items():
+            length = min(length, self.max_sentence_length)
+            bucket_counts[bisect.bisect_right(self.bucket_boundaries, length)] += count
+        num_batches = 0
+        for count, batch_size in zip(bucket_counts, self.bucket_batch_sizes):
+            num_batches += (count + batch_size - 1) // batch_size
+        return num_batches
 
     def __dataset_input_fn(self, batch_size, do_shuffle):
         """Build dataset input function.
+
+        if batch_token_size > 0, records are parsed one by one in parallel
+        since bucketing needs the length of each example, and parsed tensors are cached in memory.
+        otherwise, records are batched first and parsed by parse_example().
         """
-        filenames = [self.tfrecords_file]
-        dataset = tf.data.TFRecordDataset(filenames)
+        config = self.config
+        num_parallel_calls = config.num_parallel_calls
+        if num_parallel_calls <= 0: num_parallel_calls = multiprocessing.cpu_count()
+        filenames = self.tfrecords_files
+        # read shards in an interleaved way.
+        dataset = tf.data.Dataset.from_tensor_slices(filenames)
+        if do_shuffle: dataset = dataset.shuffle(buffer_size=len(filenames))
+        dataset = dataset.apply(tf.contrib.data.parallel_interleave(
+            lambda filename: tf.data.TFRecordDataset(filename, compression_type='GZIP'),
+            cycle_length=len(filenames),
+            sloppy=do_shuffle))
+
+        padded_shapes = self.__padded_shapes()
 
         def parser(record):
             parsed = tf.parse_single_example(record, self.keys_to_features)
+            for key in parsed:
+                if key == 'ex_index':
+                    parsed[key] = tf.cast(parsed[key], tf.int32)
+                    continue
+                parsed[key] = tf.cast(tf.sparse_tensor_to_dense(parsed[key]), tf.int32)
             # convert 1D back to original dimension.
-            if 'bert' in self.config.emb_class:
-                parsed['word_ids'] = tf.cast(parsed['word_ids'], tf.int32)
-                parsed['wordchr_ids'] = tf.reshape(tf.cast(parsed['wordchr_ids'], tf.int32), [-1, self.config.word_length])
-                parsed['pos_ids'] = tf.cast(parsed['pos_ids'], tf.int32)
-                parsed['chk_ids'] = tf.cast(parsed['chk_ids'], tf.int32)
-                parsed['bert_token_ids'] = tf.cast(parsed['bert_token_ids'], tf.int32)
-                parsed['bert_token_masks'] = tf.cast(parsed['bert_token_masks'], tf.int32)
-                parsed['bert_segment_ids'] = tf.cast(parsed['bert_segment_ids'], tf.int32)
-                parsed['bert_wordidx2tokenidx'] = tf.cast(parsed['bert_wordidx2tokenidx'], tf.int32)
-                if 'elmo' in self.config.emb_class:
-                    parsed['elmo_wordchr_ids'] = tf.reshape(tf.cast(parsed['elmo_wordchr_ids'], tf.int32), [-1, self.config.word_length])
-                if self.build_output:
-                    parsed['tags'] = tf.reshape(tf.cast(parsed['tags'], tf.int32), [-1, self.config.class_size])
-            else:
-                parsed['word_ids'] = tf.cast(parsed['word_ids'], tf.int32)
-                parsed['wordchr_ids'] = tf.reshape(tf.cast(parsed['wordchr_ids'], tf.int32), [-1, self.config.word_length])
-                parsed['pos_ids'] = tf.cast(parsed['pos_ids'], tf.int32)
-                parsed['chk_ids'] = tf.cast(parsed['chk_ids'], tf.int32)
-                if 'elmo' in self.config.emb_class:
-                    parsed['elmo_wordchr_ids'] = tf.reshape(tf.cast(parsed['elmo_wordchr_ids'], tf.int32), [-1, self.config.word_length])
-                if self.build_output:
-                    parsed['tags'] = tf.reshape(tf.cast(parsed['tags'], tf.int32), [-1, self.config.class_size])
+            parsed['wordchr_ids'] = tf.reshape(parsed['wordchr_ids'], [-1, config.word_length])
+            if 'elmo' in config.emb_class:
+                parsed['elmo_wordchr_ids'] = tf.reshape(parsed['elmo_wordchr_ids'], [-1, config.word_length])
             return parsed
 
-        dataset = dataset.map(parser)
-        if do_shuffle: dataset = dataset.shuffle(buffer_size=10000)
-        dataset = dataset.batch(batch_size)
+        def batch_parser(records):
+            parsed = tf.parse_example(records, self.keys_to_features)
+            for key in parsed:
+                if key == 'ex_index':
+                    parsed[key] = tf.cast(parsed[key], tf.int32)
+                    continue
+                # pad to the longest one in a batch
+                parsed[key] = tf.cast(tf.sparse_tensor_to_dense(parsed[key]), tf.int32)
+            # convert 2D back to original dimension.
+            batch = tf.shape(parsed['word_ids'])[0]
+            parsed['wordchr_ids'] = tf.reshape(parsed['wordchr_ids'], [batch, -1, config.word_length])
+            if 'elmo' in config.emb_class:
+                parsed['elmo_wordchr_ids'] = tf.reshape(parsed['elmo_wordchr_ids'], [batch, -1, config.word_length])
+            return parsed
+
+        def element_length_fn(parsed):
+            return tf.shape(parsed['word_ids'])[0]
+
+        if self.batch_token_size > 0:
+            dataset = dataset.map(parser, num_parallel_calls=num_parallel_calls)
+            # parsed tensors are kept in memory after the first epoch.
+            dataset = dataset.cache()
+            if do_shuffle: dataset = dataset.shuffle(buffer_size=config.shuffle_buffer_size)
+            dataset = dataset.apply(tf.contrib.data.bucket_by_sequence_length(element_length_fn,
+                                                                              self.bucket_boundaries,
+                                                                              self.bucket_batch_sizes,
+                                                                              padded_shapes=padded_shapes))
+        elif do_shuffle:
+            # serialized records are kept in memory after the first epoch,
+            # batches are composed again for every epoch.
+            dataset = dataset.cache()
+            dataset = dataset.shuffle(buffer_size=config.shuffle_buffer_size)
+            dataset = dataset.batch(batch_size)
+            dataset = dataset.map(batch_parser, num_parallel_calls=num_parallel_calls)
+        else:
+            dataset = dataset.batch(batch_size)
+            dataset = dataset.map(batch_parser, num_parallel_calls=num_parallel_calls)
+            # parsed batches are kept in memory after the first epoch.
+            dataset = dataset.cache()
+        # overlap input with compute.
+        dataset = dataset.prefetch(config.prefetch_size)
         return dataset
 
     def __create_single_tf_example(self, bucket, ex_index, is_inference=False):
@@ -151,20 +420,21 @@ class Input:
         if 'bert' in self.config.emb_class:
             bert_token_ids, bert_token_masks, bert_segment_ids, \
             bert_word_ids, bert_wordchr_ids, bert_pos_ids, bert_chk_ids, \
-            bert_tags, bert_wordidx2tokenidx = self.__create_bert_input(bucket, ex_index)
-            example['word_ids'] = bert_word_ids                             # [bert_max_seq_length]
-            example['wordchr_ids'] = bert_wordchr_ids                       # [bert_max_seq_length, word_length]
-            example['pos_ids'] = bert_pos_ids                               # [bert_max_seq_length]
-            example['chk_ids'] = bert_chk_ids                               # [bert_max_seq_length]
-            example['bert_token_ids'] = bert_token_ids                      # [bert_max_seq_length]
-            example['bert_token_masks'] = bert_token_masks                  # [bert_max_seq_length]
-            example['bert_segment_ids'] = bert_segment_ids                  # [bert_max_seq_length]
-            example['bert_wordidx2tokenidx'] = bert_wordidx2tokenidx        # [bert_max_seq_length]
+            bert_tags, bert_wordidx2tokenidx, bert_word_idx = self.__create_bert_input(bucket, ex_index)
+            example['word_ids'] = bert_word_ids                             # [max_sentence_length]
+            example['wordchr_ids'] = bert_wordchr_ids                       # [max_sentence_length, word_length]
+            example['pos_ids'] = bert_pos_ids                               # [max_sentence_length]
+            example['chk_ids'] = bert_chk_ids                               # [max_sentence_length]
+            example['bert_token_ids'] = bert_token_ids                      # [number of word pieces]
+            example['bert_token_masks'] = bert_token_masks                  # [number of word pieces]
+            example['bert_segment_ids'] = bert_segment_ids                  # [number of word pieces]
+            example['bert_wordidx2tokenidx'] = bert_wordidx2tokenidx        # [max_sentence_length+1]
             if 'elmo' in self.config.emb_class:
-                elmo_wordchr_ids = self.__create_elmo_wordchr_ids(bucket)
-                example['elmo_wordchr_ids'] = elmo_wordchr_ids              # [bert_max_seq_length+2, word_length]
+                # encode only the words which were kept by __create_bert_input(), aligned with word_ids.
+                elmo_wordchr_ids = self.__create_elmo_wordchr_ids([bucket[i] for i in bert_word_idx])
+                example['elmo_wordchr_ids'] = elmo_wordchr_ids              # [max_sentence_length+2, word_length]
             if self.build_output:
-                example['tags'] = bert_tags                                 # [bert_max_seq_length, class_size]
+                example['tags'] = bert_tags                                 # [max_sentence_length]
         else:
             word_ids = self.__create_word_ids(bucket)
             wordchr_ids = self.__create_wordchr_ids(bucket)
@@ -179,7 +449,7 @@ class Input:
                 example['elmo_wordchr_ids'] = elmo_wordchr_ids              # [max_sentence_length+2, word_length]
             if self.build_output:
                 tags = self.__create_tags(bucket)
-                example['tags'] = tags                                      # [max_sentence_length, class_size]
+                example['tags'] = tags                                      # [max_sentence_length]
 
         if is_inference:
             for key, val in example.items():
@@ -192,36 +462,29 @@ class Input:
             f = tf.train.Feature(int64_list=tf.train.Int64List(value=list(values)))
             return f
 
-        # create tf example(need to flat).
+        # create tf example without padding(need to flat).
+        length = len([pid for pid in example['pos_ids'] if pid != self.config.embvec.pad_pid])
         features = collections.OrderedDict()
+        features['ex_index'] = create_int_feature([ex_index])
+        features['word_ids'] = create_int_feature(example['word_ids'][:length])
+        t = np.reshape(example['wordchr_ids'][:length], -1)
+        features['wordchr_ids'] = create_int_feature(t)
+        features['pos_ids'] = create_int_feature(example['pos_ids'][:length])
+        features['chk_ids'] = create_int_feature(example['chk_ids'][:length])
         if 'bert' in self.config.emb_class:
-            features['word_ids'] = create_int_feature(example['word_ids'])
-            t = np.reshape(example['wordchr_ids'], -1)
-            features['wordchr_ids'] = create_int_feature(t)
-            features['pos_ids'] = create_int_feature(example['pos_ids'])
-            features['chk_ids'] = create_int_feature(example['chk_ids'])
-            features['bert_token_ids'] = create_int_feature(example['bert_token_ids'])
-            features['bert_token_masks'] = create_int_feature(example['bert_token_masks'])
-            features['bert_segment_ids'] = create_int_feature(example['bert_segment_ids'])
-            features['bert_wordidx2tokenidx'] = create_int_feature(example['bert_wordidx2tokenidx'])
-            if 'elmo' in self.config.emb_class:
-                t = np.reshape(example['elmo_wordchr_ids'], -1)
-                features['elmo_wordchr_ids'] = create_int_feature(t)
-            if self.build_output:
-                t = np.reshape(example['tags'], -1)
-                features['tags'] = create_int_feature(t)
-        else:
-            features['word_ids'] = create_int_feature(example['word_ids'])
-            t = np.reshape(example['wordchr_ids'], -1)
-            features['wordchr_ids'] = create_int_feature(t)
-            features['pos_ids'] = create_int_feature(example['pos_ids'])
-            features['chk_ids'] = create_int_feature(example['chk_ids'])
-            if 'elmo' in self.config.emb_class:
-                t = np.reshape(example['elmo_wordchr_ids'], -1)
-                features['elmo_wordchr_ids'] = create_int_feature(t)
-            if self.build_output:
-                t = np.reshape(example['tags'], -1)
-                features['tags'] = create_int_feature(t)
+            token_length = sum(example['bert_token_masks'])
+            features['bert_token_ids'] = create_int_feature(example['bert_token_ids'][:token_length])
+            features['bert_token_masks'] = create_int_feature(example['bert_token_masks'][:token_length])
+            features['bert_segment_ids'] = create_int_feature(example['bert_segment_ids'][:token_length])
+            # including last+1 token idx
+            features['bert_wordidx2tokenidx'] = create_int_feature(example['bert_wordidx2tokenidx'][:length+1])
+        if 'elmo' in self.config.emb_class:
+            # '+2' stands for '<S>, </S>'
+            elmo_length = length + 2
+            t = np.reshape(example['elmo_wordchr_ids'][:elmo_length], -1)
+            features['elmo_wordchr_ids'] = create_int_feature(t)
+        if self.build_output:
+            features['tags'] = create_int_feature(example['tags'][:length])
 
         tf_example = tf.train.Example(features=tf.train.Features(feature=features))
         return tf_example, example
@@ -241,6 +504,7 @@ class Input:
                bert chk id,
                bert tag
                bert wordidx to tokenidx
+               indices of words which have word pieces(not truncated)
         """
         word_ids = self.__create_word_ids(bucket)
         wordchr_ids = self.__create_wordchr_ids(bucket)
@@ -253,6 +517,7 @@ class Input:
         bert_pos_ids = []
         bert_chk_ids = []
         bert_tags = []
+        bert_word_idx = []
 
         pad_chr_ids = []
         for _ in range(self.config.word_length):
@@ -261,22 +526,22 @@ class Input:
         bert_tokenizer = self.config.bert_tokenizer
         bert_max_seq_length = self.config.bert_max_seq_length
         ntokens = []
+        bert_token_ids = []
         bert_segment_ids = []
         bert_wordidx2tokenidx = []
 
         tokenidx = 0
         ntokens.append('[CLS]')
+        bert_token_ids.append(bert_tokenizer.cls_id)
         bert_segment_ids.append(0)
         tokenidx += 1
 
-        for i, line in enumerate(bucket):
-            line = line.strip()
-            tokens = line.split()
-            assert (len(tokens) == 4)
-            word = tokens[0]
-            bert_tokens = bert_tokenizer.tokenize(word)
+        # word pieces of each word(cached).
+        bucket_tokens = bert_tokenizer.tokenize_bucket(bucket)
+        for i, (bert_tokens, bert_ids) in enumerate(bucket_tokens):
             for j, bert_token in enumerate(bert_tokens):
                 ntokens.append(bert_token)
+                bert_token_ids.append(bert_ids[j])
                 bert_segment_ids.append(0)
                 if j == 0:
                     bert_word_ids.append(word_ids[i])
@@ -285,6 +550,7 @@ class Input:
                     bert_chk_ids.append(chk_ids[i])
                     bert_tags.append(tags[i])
                     bert_wordidx2tokenidx.append(tokenidx)
+                    bert_word_idx.append(i)
                 tokenidx += 1
             if len(ntokens) == bert_max_seq_length - 1:
                 tf.logging.debug('len(ntokens): %s' % str(len(ntokens)))
@@ -296,33 +562,28 @@ class Input:
         '''
         bert_wordidx2tokenidx.append(tokenidx) # indicating last+1 token idx
 
-        bert_token_ids = bert_tokenizer.convert_tokens_to_ids(ntokens)
         bert_token_masks = [1] * len(bert_token_ids)
 
-        # padding for bert_token_ids, bert_token_masks, bert_segment_ids
-        while len(bert_token_ids) < bert_max_seq_length:
-            bert_token_ids.append(0)
-            bert_token_masks.append(0)
-            bert_segment_ids.append(0)
-        assert len(bert_token_ids) == bert_max_seq_length
-        assert len(bert_token_masks) == bert_max_seq_length
-        assert len(bert_segment_ids) == bert_max_seq_length
+        # no padding for bert_token_ids, bert_token_masks, bert_segment_ids,
+        # they are padded to the longest one in a batch.
+        assert len(bert_token_ids) <= bert_max_seq_length
         # padding for bert_word_ids, bert_wordchr_ids, bert_pos_ids, bert_chk_ids, bert_tags
-        while len(bert_word_ids) < bert_max_seq_length:
+        max_sentence_length = self.max_sentence_length
+        while len(bert_word_ids) < max_sentence_length:
             bert_word_ids.append(self.config.embvec.pad_wid)
             bert_wordchr_ids.append(pad_chr_ids)
             bert_pos_ids.append(self.config.embvec.pad_pid)
             bert_chk_ids.append(self.config.embvec.pad_kid)
-            bert_tags.append(np.array([0] * self.config.class_size))
-        assert len(bert_word_ids) == bert_max_seq_length
-        assert len(bert_wordchr_ids) == bert_max_seq_length
-        assert len(bert_pos_ids) == bert_max_seq_length
-        assert len(bert_chk_ids) == bert_max_seq_length
-        assert len(bert_tags) == bert_max_seq_length
-        # padding for bert_wordidx2tokenidx (for FixedLenFeature())
-        while len(bert_wordidx2tokenidx) < bert_max_seq_length:
+            bert_tags.append(0)
+        assert len(bert_word_ids) == max_sentence_length
+        assert len(bert_wordchr_ids) == max_sentence_length
+        assert len(bert_pos_ids) == max_sentence_length
+        assert len(bert_chk_ids) == max_sentence_length
+        assert len(bert_tags) == max_sentence_length
+        # padding for bert_wordidx2tokenidx, including last+1 token idx
+        while len(bert_wordidx2tokenidx) < max_sentence_length + 1:
             bert_wordidx2tokenidx.append(0)
-        assert len(bert_wordidx2tokenidx) == bert_max_seq_length
+        assert len(bert_wordidx2tokenidx) == max_sentence_length + 1
 
         if ex_index < 5:
             from bert import tokenization  
@@ -342,7 +603,7 @@ class Input:
 
         return bert_token_ids, bert_token_masks, bert_segment_ids, \
                bert_word_ids, bert_wordchr_ids, bert_pos_ids, bert_chk_ids, \
-               bert_tags, bert_wordidx2tokenidx
+               bert_tags, bert_wordidx2tokenidx, bert_word_idx
 
     def __create_word_ids(self, bucket):
         """Create an word id vector.
@@ -398,23 +659,14 @@ class Input:
         """Create a vector of a character id vector for elmo.
         """
         sentence = []
-        sentence_length = 0
         for line in bucket:
             line = line.strip()
             tokens = line.split()
             assert (len(tokens) == 4)
-            sentence_length += 1
             word = tokens[0]
             sentence.append(word)
-            if sentence_length == self.max_sentence_length: break
-        elmo_wordchr_ids = self.config.elmo_batcher.batch_sentences([sentence])[0].tolist()
-        # padding with [0,...,0] chr_ids, '+2' stands for '<S>, </S>'
-        for _ in range(self.max_sentence_length - len(elmo_wordchr_ids) + 2):
-            chr_ids = []
-            for _ in range(self.config.word_length):
-                chr_ids.append(0)
-            elmo_wordchr_ids.append(chr_ids)
-        assert(len(elmo_wordchr_ids) == self.max_sentence_length+2)
+        # '+2' stands for '<S>, </S>', padded with [0,...,0] chr_ids.
+        elmo_wordchr_ids = self.config.elmo_char_table.encode_sentence(sentence, self.max_sentence_length)
         return elmo_wordchr_ids
 
     def __create_pos_ids(self, bucket):
@@ -456,7 +708,7 @@ class Input:
         return chk_ids
 
     def __create_tags(self, bucket):
-        """Create an output tag vector.
+        """Create an output tag id vector.
         """
         tags  = []
         sentence_length = 0
@@ -465,34 +717,31 @@ class Input:
             tokens = line.split()
             assert (len(tokens) == 4)
             sentence_length += 1
-            tags.append(self.__tag_vec(tokens[3], self.config.class_size))   # tag one-hot
+            tid = self.config.embvec.get_tid(tokens[3])
+            tags.append(tid)
             if sentence_length == self.max_sentence_length: break
-        # padding with 0s
+        # padding with 0s(masked out by sentence masks)
         for _ in range(self.max_sentence_length - sentence_length):
-            tags.append(np.array([0] * self.config.class_size))
+            tags.append(0)
         return tags
 
-    def __tag_vec(self, tag, class_size):
-        """Build one-hot vector for a tag.
-        """
-        one_hot = np.zeros(class_size, dtype=np.int32)
-        tid = self.config.embvec.get_tid(tag)
-        one_hot[tid] = 1
-        return one_hot
-
     @staticmethod
     def stat(file_name):
-        """Compute the number of examples and maximum sentence length of examples
+        """Compute the number of examples, maximum sentence length of examples
+        and the number of examples for each sentence length.
         """
         temp_len = 0
         max_length = 0
         num_examples = 0
+        length_counts = {}
         for line in open(file_name):
             if line in ['\n', '\r\n']:
                 if temp_len > max_length:
                     max_length = temp_len
+                if temp_len not in length_counts: length_counts[temp_len] = 0
+                length_counts[temp_len] += 1
                 temp_len = 0
                 num_examples += 1
             else:
                 temp_len += 1
-        return max_length, num_examples
+        return max_length, num_examples, length_counts
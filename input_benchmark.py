@@ -0,0 +1,70 @@
+from __future__ import print_function
+import sys
+import time
+import argparse
+import tensorflow as tf
+import numpy as np
+from embvec import EmbVec
+from config import Config
+from input import Input
+
+def benchmark(config, data_file, do_shuffle):
+    """Iterate input pipeline without model and report throughput.
+    """
+    data = Input(data_file, config, build_output=True, do_shuffle=do_shuffle, reuse=True)
+    tf.logging.info('num_examples = %s, num_batches = %s' % (data.num_examples, data.num_batches))
+    iterator = data.dataset.make_initializable_iterator()
+    next_element = iterator.get_next()
+    session_conf = tf.ConfigProto(allow_soft_placement=True,
+                                  log_device_placement=False,
+                                  inter_op_parallelism_threads=0,
+                                  intra_op_parallelism_threads=0)
+    sess = tf.Session(config=session_conf)
+    for e in range(config.epoch):
+        sess.run(iterator.initializer)
+        start_time = time.time()
+        num_batches = 0
+        num_examples = 0
+        num_tokens = 0
+        num_padded_tokens = 0
+        while 1:
+            try:
+                dataset = sess.run(next_element)
+            except tf.errors.OutOfRangeError:
+                break
+            num_batches += 1
+            num_examples += len(dataset['word_ids'])
+            num_tokens += np.sum(np.sign(dataset['pos_ids']))
+            num_padded_tokens += np.size(dataset['word_ids'])
+        duration_time = time.time() - start_time
+        out = '[epoch %s] ' % (e)
+        out += 'batches = %s, examples = %s, ' % (num_batches, num_examples)
+        out += 'duration_time = %s sec, ' % (duration_time)
+        out += 'examples/sec = %s, ' % (num_examples / duration_time)
+        out += 'tokens/sec = %s, ' % (num_tokens / duration_time)
+        out += 'padding ratio = %s' % (1.0 - num_tokens / max(1, num_padded_tokens))
+        tf.logging.info(out)
+    sess.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--emb_path', type=str, help='path to word embedding vector + vocab(.pkl)', required=True)
+    parser.add_argument('--wrd_dim', type=int, help='dimension of word embedding vector', required=True)
+    parser.add_argument('--word_length', type=int, default=15, help='max word length')
+    parser.add_argument('--batch_size', type=int, default=128, help='batch size of training')
+    parser.add_argument('--batch_token_size', type=int, default=0, help='maximum number of tokens per batch(length-bucketed), 0 for fixed batch_size')
+    parser.add_argument('--bucket_width', type=int, default=5, help='width of sentence length buckets for batch_token_size')
+    parser.add_argument('--epoch', type=int, default=3, help='number of epochs, epochs after the first one read from cache')
+    parser.add_argument('--data_path', type=str, default='data/train.txt', help='path to data file')
+    parser.add_argument('--shuffle', type=str, default='True', help='shuffle data like training')
+    parser.add_argument('--emb_class', type=str, default='glove', help='class of embedding(glove, elmo, bert, bert+elmo)')
+
+    args = parser.parse_args()
+    tf.logging.set_verbosity(tf.logging.INFO)
+
+    # dummy arguments for Config
+    args.restore = None
+    args.checkpoint_dir = None
+    args.summary_dir = None
+    config = Config(args, is_training=True, emb_class=args.emb_class, use_crf=True)
+    benchmark(config, args.data_path, args.shuffle == 'True')
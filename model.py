@@ -1,4 +1,5 @@
 from __future__ import print_function
+import copy
 import tensorflow as tf
 from tensorflow.contrib.layers.python.layers import initializers
 import numpy as np
@@ -8,13 +9,17 @@ from ops import multihead_attention, feedforward, normalize, positional_encoding
 
 class Model:
 
-    def __init__(self, config):
+    def __init__(self, config, features=None):
         """Build model(define computational blocks).
 
         Args:
           config: an instance of Config class.
+          features: output tensors of dataset iterator(dict), optional.
+            if given, input placeholders take their default values from the iterator
+            so that training runs without feed_dict. otherwise(inference, export), plain placeholders.
         """
         self.config = config
+        self.features = features
         self.embvec = config.embvec
         self.wrd_vocab_size = len(self.embvec.wrd_embeddings)
         self.wrd_dim = config.wrd_dim
@@ -35,11 +40,14 @@ class Model:
         Input layer
         """
         self.is_train = tf.placeholder(tf.bool, name='is_train')
-        self.sentence_length = tf.placeholder(tf.int32, name='sentence_length')
+        if self.features is not None:
+            self.sentence_length = tf.placeholder_with_default(tf.shape(self.features['word_ids'])[1], shape=[], name='sentence_length')
+        else:
+            self.sentence_length = tf.placeholder(tf.int32, name='sentence_length')
         self.keep_prob = tf.cond(self.is_train, lambda: config.keep_prob, lambda: 1.0)
 
         # pos embedding
-        self.input_data_pos_ids = tf.placeholder(tf.int32, shape=[None, None], name='input_data_pos_ids') # (batch_size, sentence_length)
+        self.input_data_pos_ids = self.__input_placeholder(tf.int32, [None, None], 'input_data_pos_ids', 'pos_ids') # (batch_size, sentence_length)
         self.sentence_masks   = self.__compute_sentence_masks(self.input_data_pos_ids)
         sentence_lengths = self.__compute_sentence_lengths(self.sentence_masks)
         self.sentence_lengths = tf.identity(sentence_lengths, name='sentence_lengths')
@@ -47,61 +55,84 @@ class Model:
         self.pos_embeddings = self.__pos_embedding(self.input_data_pos_ids, keep_prob=self.keep_prob, scope='pos-embedding')
 
         # chk embedding
-        self.input_data_chk_ids = tf.placeholder(tf.int32, shape=[None, None], name='input_data_chk_ids') # (batch_size, sentence_length)
+        self.input_data_chk_ids = self.__input_placeholder(tf.int32, [None, None], 'input_data_chk_ids', 'chk_ids') # (batch_size, sentence_length)
         self.chk_embeddings = self.__chk_embedding(self.input_data_chk_ids, keep_prob=self.keep_prob, scope='chk-embedding')
 
         # (large) word embedding data
         self.wrd_embeddings_init = tf.placeholder(tf.float32, shape=[self.wrd_vocab_size, self.wrd_dim], name='wrd_embeddings_init')
         self.wrd_embeddings = tf.Variable(self.wrd_embeddings_init, name='wrd_embeddings', trainable=False)
         # word embeddings
-        self.input_data_word_ids = tf.placeholder(tf.int32, shape=[None, None], name='input_data_word_ids') # (batch_size, sentence_length)
+        self.input_data_word_ids = self.__input_placeholder(tf.int32, [None, None], 'input_data_word_ids', 'word_ids') # (batch_size, sentence_length)
         self.word_embeddings = self.__word_embedding(self.input_data_word_ids, keep_prob=self.keep_prob, scope='word-embedding')
 
         # character embeddings
-        self.input_data_wordchr_ids = tf.placeholder(tf.int32,
-                                                     shape=[None, None, self.word_length], # (batch_size, sentence_length, word_length)
-                                                     name='input_data_wordchr_ids')
+        self.input_data_wordchr_ids = self.__input_placeholder(tf.int32,
+                                                               [None, None, self.word_length], # (batch_size, sentence_length, word_length)
+                                                               'input_data_wordchr_ids',
+                                                               'wordchr_ids')
+        # char-cnn outputs of known word forms(inference only, see inference/export_form_table.py)
+        form_ids = None
+        if config.form_table is not None:
+            self.form_embeddings = tf.constant(config.form_table, dtype=tf.float32, name='form_embeddings')
+            self.input_data_form_ids = self.__input_placeholder(tf.int32, [None, None], 'input_data_form_ids', 'form_ids') # (batch_size, sentence_length)
+            form_ids = self.input_data_form_ids
         if config.chr_conv_type == 'conv1d':
             self.wordchr_embeddings = self.__wordchr_embedding_conv1d(self.input_data_wordchr_ids,
                                                                       keep_prob=self.keep_prob,
-                                                                      scope='wordchr-embedding-conv1d')
+                                                                      scope='wordchr-embedding-conv1d',
+                                                                      form_ids=form_ids)
         else:
             self.wordchr_embeddings = self.__wordchr_embedding_conv2d(self.input_data_wordchr_ids,
                                                                       keep_prob=self.keep_prob,
-                                                                      scope='wordchr-embedding-conv2d')
+                                                                      scope='wordchr-embedding-conv2d',
+                                                                      form_ids=form_ids)
 
         if 'elmo' in self.emb_class:
             # elmo embeddings
             self.elmo_bilm = config.elmo_bilm
             elmo_keep_prob = tf.cond(self.is_train, lambda: config.elmo_keep_prob, lambda: 1.0)
-            self.elmo_input_data_wordchr_ids = tf.placeholder(tf.int32,
-                                                              shape=[None, None, self.word_length], # (batch_size, sentence_length+2, word_length)
-                                                              name='elmo_input_data_wordchr_ids')   # '+2' stands for '<S>', '</S>'
-            self.elmo_embeddings = self.__elmo_embedding(self.elmo_input_data_wordchr_ids, masks, keep_prob=elmo_keep_prob)
+            self.elmo_input_data_wordchr_ids = self.__input_placeholder(tf.int32,
+                                                                        [None, None, self.word_length], # (batch_size, sentence_length+2, word_length)
+                                                                        'elmo_input_data_wordchr_ids',  # '+2' stands for '<S>', '</S>'
+                                                                        'elmo_wordchr_ids')
+            # biLM layer activations in subgraph
+            elmo_layers_subgraph = self.__elmo_layers(self.elmo_input_data_wordchr_ids)
+            self.elmo_layers_subgraph = tf.identity(elmo_layers_subgraph, name='elmo_layers_subgraph')
+            # precomputed biLM layer activations can be fed at runtime(see train.py), then the biLM is not evaluated.
+            self.elmo_layers = tf.placeholder_with_default(self.elmo_layers_subgraph,
+                                                           shape=self.elmo_layers_subgraph.get_shape(),
+                                                           name='elmo_layers') # (batch_size, sentence_length, n_lm_layers, elmo_dim)
+            self.elmo_embeddings = self.__elmo_embedding(self.elmo_layers, masks, keep_prob=elmo_keep_prob)
         if 'bert' in self.emb_class:
             # bert embeddings in subgraph
             self.bert_config = config.bert_config
             self.bert_init_checkpoint = config.bert_init_checkpoint
-            self.bert_input_data_token_ids   = tf.placeholder(tf.int32, shape=[None, config.bert_max_seq_length], name='bert_input_data_token_ids')
-            self.bert_input_data_token_masks = tf.placeholder(tf.int32, shape=[None, config.bert_max_seq_length], name='bert_input_data_token_masks') 
-            self.bert_input_data_segment_ids = tf.placeholder(tf.int32, shape=[None, config.bert_max_seq_length], name='bert_input_data_segment_ids') 
+            bert_shape = [None, None] # (batch_size, number of word pieces), at most bert_max_seq_length
+            self.bert_input_data_token_ids   = self.__input_placeholder(tf.int32, bert_shape, 'bert_input_data_token_ids', 'bert_token_ids')
+            self.bert_input_data_token_masks = self.__input_placeholder(tf.int32, bert_shape, 'bert_input_data_token_masks', 'bert_token_masks')
+            self.bert_input_data_segment_ids = self.__input_placeholder(tf.int32, bert_shape, 'bert_input_data_segment_ids', 'bert_segment_ids')
+            self.bert_input_data_wordidx2tokenidx = self.__input_placeholder(tf.int32, bert_shape, 'bert_input_data_wordidx2tokenidx', 'bert_wordidx2tokenidx')
             bert_embeddings_subgraph = self.__bert_embedding(self.bert_input_data_token_ids,
                                                              self.bert_input_data_token_masks,
                                                              self.bert_input_data_segment_ids)
             self.bert_embeddings_subgraph = tf.identity(bert_embeddings_subgraph, name='bert_embeddings_subgraph')
 
-            # bert embedding at runtime
-            self.bert_embeddings = tf.placeholder(tf.float32, shape=[None, config.bert_max_seq_length, config.bert_dim], name='bert_embeddings')
+            # align word pieces to words in graph.
+            # precomputed bert embeddings can be fed at runtime(see train.py), then bert is not evaluated.
+            bert_embeddings = self.__align_bert_embeddings(self.bert_embeddings_subgraph, self.bert_input_data_wordidx2tokenidx)
+            self.bert_embeddings = tf.placeholder_with_default(bert_embeddings,
+                                                               shape=[None, None, config.bert_dim],
+                                                               name='bert_embeddings')
             bert_keep_prob = tf.cond(self.is_train, lambda: config.bert_keep_prob, lambda: 1.0)
-            self.bert_embeddings = tf.nn.dropout(self.bert_embeddings, bert_keep_prob)
+            bert_embeddings = tf.nn.dropout(self.bert_embeddings, bert_keep_prob)
 
         concat_in = [self.word_embeddings, self.wordchr_embeddings, self.pos_embeddings, self.chk_embeddings]
         if self.emb_class == 'elmo':
             concat_in = [self.word_embeddings, self.wordchr_embeddings, self.elmo_embeddings, self.pos_embeddings, self.chk_embeddings]
         if self.emb_class == 'bert':
-            concat_in = [self.word_embeddings, self.wordchr_embeddings, self.bert_embeddings, self.pos_embeddings, self.chk_embeddings]
+            concat_in = [self.word_embeddings, self.wordchr_embeddings, bert_embeddings, self.pos_embeddings, self.chk_embeddings]
         if self.emb_class == 'bert+elmo':
-            concat_in = [self.word_embeddings, self.wordchr_embeddings, self.bert_embeddings, self.elmo_embeddings, self.pos_embeddings, self.chk_embeddings]
+            concat_in = [self.word_embeddings, self.wordchr_embeddings, bert_embeddings, self.elmo_embeddings, self.pos_embeddings, self.chk_embeddings]
         self.input_data = tf.concat(concat_in, axis=-1, name='input_data') # (batch_size, sentence_length, input_dim)
         
         # highway network
@@ -135,10 +166,11 @@ class Model:
         """
         Output answer
         """
-        self.output_data = tf.placeholder(tf.float32,
-                                          shape=[None, None, self.class_size], # (batch_size, sentence_length, class_size)
-                                          name='output_data')
-        self.output_data_indices = tf.argmax(self.output_data, axis=-1, output_type=tf.int32) # (batch_size, sentence_length)
+        self.output_data = self.__input_placeholder(tf.int32,
+                                                    [None, None], # (batch_size, sentence_length)
+                                                    'output_data', # tag ids
+                                                    'tags')
+        self.output_data_indices = self.output_data             # (batch_size, sentence_length)
 
         """
         Prediction
@@ -243,6 +275,37 @@ class Model:
         sess.run(tf.local_variables_initializer()) # for tf_metrics
         self.sess = sess
  
+    def build_for_inference(self):
+        """Create session and restore variables of the forward graph only, instead of compile().
+        loss, optimizer slots and metrics are not built, and wrd_embeddings is restored
+        from the checkpoint(config.restore) without feeding wrd_embeddings_init.
+        """
+        config = self.config
+        session_conf = tf.ConfigProto(allow_soft_placement=True,
+                                      log_device_placement=False,
+                                      inter_op_parallelism_threads=0,
+                                      intra_op_parallelism_threads=0)
+        session_conf.gpu_options.allow_growth = True
+        sess = tf.Session(config=session_conf)
+        saved = set([name for name, _ in tf.train.list_variables(config.restore)])
+        restore_vars = [v for v in tf.global_variables() if v.op.name in saved]
+        init_vars = [v for v in tf.global_variables() if v.op.name not in saved]
+        if self.wrd_embeddings in init_vars:
+            raise ValueError('wrd_embeddings is not found in %s' % config.restore)
+        # variables which are not saved(ex, states of biLM) are initialized.
+        if init_vars: sess.run(tf.variables_initializer(init_vars))
+        saver = tf.train.Saver(restore_vars)
+        saver.restore(sess, config.restore)
+        self.sess = sess
+
+    def __input_placeholder(self, dtype, shape, name, key):
+        """Create an input placeholder,
+        with the default value from the dataset iterator if available.
+        """
+        if self.features is not None and key in self.features:
+            return tf.placeholder_with_default(self.features[key], shape=shape, name=name)
+        return tf.placeholder(dtype, shape=shape, name=name)
+
     def __word_embedding(self, inputs, keep_prob=0.5, scope='word-embedding'):
         """Look up word embeddings.
         """
@@ -251,39 +314,55 @@ class Model:
                 word_embeddings = tf.nn.embedding_lookup(self.wrd_embeddings, inputs) # (batch_size, sentence_length, wrd_dim)
             return tf.nn.dropout(word_embeddings, keep_prob)
 
-    def __wordchr_embedding_conv1d(self, inputs, keep_prob=0.5, scope='wordchr-embedding-conv1d'):
+    def __wordchr_embedding_conv1d(self, inputs, keep_prob=0.5, scope='wordchr-embedding-conv1d', form_ids=None):
         """Compute character embeddings by masked conv1d and max-pooling.
+        if form_ids is given, only words without cached outputs are convolved.
+        if config.chr_conv_unique, only unique words of the batch are convolved.
         """
         with tf.variable_scope(scope):
+            t = tf.reshape(inputs, [-1, self.word_length])  # (batch_size*sentence_length, word_length)
+            num_words = tf.shape(t)[0]
+            selected, unique_idx = None, None
+            if form_ids is not None or self.config.chr_conv_unique:
+                t, selected = self.__select_words(t, form_ids)
+            if self.config.chr_conv_unique:
+                t, unique_idx = self.__unique_words(t)
             with tf.device('/cpu:0'):
                 chr_embeddings = tf.Variable(tf.random_uniform([self.chr_vocab_size, self.chr_dim], -1.0, 1.0),
                                              name='chr_embeddings')
-                wordchr_embeddings_t = tf.nn.embedding_lookup(chr_embeddings, inputs) # (batch_size, sentence_length, word_length, chr_dim)
+                wordchr_embeddings_t = tf.nn.embedding_lookup(chr_embeddings, t) # (batch_size*sentence_length, word_length, chr_dim)
                 wordchr_embeddings_t = tf.nn.dropout(wordchr_embeddings_t, keep_prob)
-            wordchr_embeddings_t = tf.reshape(wordchr_embeddings_t,
-                                              [-1, self.word_length, self.chr_dim])   # (batch_size*sentence_length, word_length, chr_dim)
             # masking
-            t = tf.reshape(inputs, [-1, self.word_length])  # (batch_size*sentence_length, word_length) 
             masks = self.__compute_word_masks(t)            # (batch_size*sentence_length, word_length)
             filters = self.config.num_filters
             kernel_size = self.config.filter_sizes[0]
             wordchr_embeddings = masked_conv1d_and_max(wordchr_embeddings_t, masks, filters, kernel_size, tf.nn.relu)
+            if unique_idx is not None:
+                wordchr_embeddings = tf.gather(wordchr_embeddings, unique_idx)
+            if selected is not None:
+                wordchr_embeddings = self.__scatter_words(wordchr_embeddings, selected, num_words, form_ids)
             # (batch_size*sentence_length, filters) -> (batch_size, sentence_length, filters)
             wordchr_embeddings = tf.reshape(wordchr_embeddings, [-1, self.sentence_length, filters])
             return tf.nn.dropout(wordchr_embeddings, keep_prob)
 
-    def __wordchr_embedding_conv2d(self, inputs, keep_prob=0.5, scope='wordchr-embedding-conv2d'):
+    def __wordchr_embedding_conv2d(self, inputs, keep_prob=0.5, scope='wordchr-embedding-conv2d', form_ids=None):
         """Compute character embeddings by conv2d and max-pooling.
+        if form_ids is given, only words without cached outputs are convolved.
+        if config.chr_conv_unique, only unique words of the batch are convolved.
         """
         with tf.variable_scope(scope):
+            t = tf.reshape(inputs, [-1, self.word_length])   # (batch_size*sentence_length, word_length)
+            num_words = tf.shape(t)[0]
+            selected, unique_idx = None, None
+            if form_ids is not None or self.config.chr_conv_unique:
+                t, selected = self.__select_words(t, form_ids)
+            if self.config.chr_conv_unique:
+                t, unique_idx = self.__unique_words(t)
             with tf.device('/cpu:0'):
                 chr_embeddings = tf.Variable(tf.random_uniform([self.chr_vocab_size, self.chr_dim], -1.0, 1.0),
                                               name='chr_embeddings')
-                wordchr_embeddings_t = tf.nn.embedding_lookup(chr_embeddings, inputs) # (batch_size, sentence_length, word_length, chr_dim)
-            wordchr_embeddings_t = tf.reshape(wordchr_embeddings_t,
-                                              [-1, self.word_length, self.chr_dim])   # (batch_size*sentence_length, word_length, chr_dim)
+                wordchr_embeddings_t = tf.nn.embedding_lookup(chr_embeddings, t) # (batch_size*sentence_length, word_length, chr_dim)
             # masking
-            t = tf.reshape(inputs, [-1, self.word_length])   # (batch_size*sentence_length, word_length) 
             masks = self.__compute_word_masks(t)             # (batch_size*sentence_length, word_length)
             masks = tf.expand_dims(masks, -1)                # (batch_size*sentence_length, word_length, 1)
             wordchr_embeddings_t *= tf.to_float(masks)       # broadcasting
@@ -324,15 +403,81 @@ class Model:
             h_pool Tensor("concat:0", shape=(?, 1, 1, num_filters_total), dtype=float32)
             h_pool_flat Tensor("Reshape:0", shape=(?, num_filters_total), dtype=float32)
             """
+            if unique_idx is not None:
+                h_pool_flat = tf.gather(h_pool_flat, unique_idx)
+            if selected is not None:
+                h_pool_flat = self.__scatter_words(h_pool_flat, selected, num_words, form_ids)
             # (batch_size*sentence_length, num_filters_total) -> (batch_size, sentence_length, num_filters_total)
             wordchr_embeddings = tf.reshape(h_pool_flat, [-1, self.sentence_length, num_filters_total])
             return tf.nn.dropout(wordchr_embeddings, keep_prob)
 
-    def __elmo_embedding(self, inputs, masks, keep_prob=0.8):
-        """Compute ELMo embeddings.
+    def __select_words(self, t, form_ids=None):
+        """Select character ids of words to be convolved, except paddings.
+        if form_ids is given, words with cached char-cnn outputs(form id > 0) are excluded too.
+
+        Args:
+          t: (batch_size*sentence_length, word_length)
+          form_ids: (batch_size, sentence_length), optional.
+        Returns:
+          (number of selected words, word_length), indices of selected words
+        """
+        selected = tf.reduce_any(tf.greater(t, 0), axis=-1)
+        if form_ids is not None:
+            selected = tf.logical_and(selected, tf.equal(tf.reshape(form_ids, [-1]), 0))
+        selected = tf.where(selected)[:, 0]
+        return tf.gather(t, selected), selected
+
+    def __unique_words(self, t):
+        """Find unique rows of character ids.
+        tf.unique() works on 1-D tensors, so each row is hashed to an int64 key by
+        random odd multipliers per position(wrapping around 2^64), without string conversion.
+        the probability of a collision among the words of a batch is negligible(about n^2 / 2^64).
+
+        Args:
+          t: (number of words, word_length)
+        Returns:
+          (number of unique words, word_length), index of the unique word for each word
+        """
+        rng = np.random.RandomState(self.word_length)
+        multipliers = rng.randint(0, 1 << 62, size=[self.word_length], dtype=np.int64).astype(np.uint64) * 4 + 1
+        multipliers = tf.constant(multipliers.view(np.int64), dtype=tf.int64)
+        keys = tf.reduce_sum(tf.to_int64(t) * multipliers, axis=-1) # (number of words)
+        unique_keys, unique_idx = tf.unique(keys)
+        # first occurrence of each unique word.
+        first = tf.unsorted_segment_min(tf.range(tf.shape(t)[0]), unique_idx, tf.shape(unique_keys)[0])
+        return tf.gather(t, first), unique_idx
+
+    def __scatter_words(self, outputs, selected, num_words, form_ids=None):
+        """Scatter char-cnn outputs of selected words back to all words, zeros for paddings.
+        if form_ids is given, the others take cached outputs(row 0 of form_embeddings is zeros).
+
+        Args:
+          outputs: (number of selected words, filters)
+          selected: indices of selected words
+          num_words: batch_size*sentence_length
+          form_ids: (batch_size, sentence_length), optional.
+        Returns:
+          (batch_size*sentence_length, filters)
+        """
+        shape = tf.stack([tf.to_int64(num_words), tf.shape(outputs, out_type=tf.int64)[1]])
+        outputs = tf.scatter_nd(tf.expand_dims(selected, 1), outputs, shape)
+        if form_ids is not None:
+            outputs += tf.nn.embedding_lookup(self.form_embeddings, tf.reshape(form_ids, [-1]))
+        return outputs
+
+    def __elmo_layers(self, inputs):
+        """Compute biLM layer activations without '<S>', '</S>'.
         """
-        from bilm import weight_layers
         elmo_embeddings_op = self.elmo_bilm(inputs)
+        # (batch_size, n_lm_layers, sentence_length, elmo_dim) -> (batch_size, sentence_length, n_lm_layers, elmo_dim)
+        return tf.transpose(elmo_embeddings_op['lm_embeddings'], [0, 2, 1, 3])
+
+    def __elmo_embedding(self, layers, masks, keep_prob=0.8):
+        """Compute ELMo embeddings from biLM layer activations, only the scalar mix is trainable.
+        """
+        from bilm import weight_layers
+        elmo_embeddings_op = {'lm_embeddings': tf.transpose(layers, [0, 2, 1, 3]),
+                              'mask': tf.cast(self.sentence_masks, tf.bool)}
         elmo_input = weight_layers('input', elmo_embeddings_op, l2_coef=0.0)
         elmo_embeddings = elmo_input['weighted_op'] # (batch_size, sentence_length, elmo_dim)
         # masking(remove noise due to padding)
@@ -343,19 +488,19 @@ class Model:
         """Compute BERT embeddings in sub-graph.
         """
         from bert import modeling
+        # build layers up to bert_layer only, upper layers are not used.
+        bert_config = copy.deepcopy(self.bert_config)
+        bert_config.num_hidden_layers = self.config.bert_layer
         bert_model = modeling.BertModel(
-            config=self.bert_config,
+            config=bert_config,
             is_training=False, # disable dropout
             input_ids=token_ids,
             input_mask=token_masks,
             token_type_ids=segment_ids,
             use_one_hot_embeddings=False)
-        # last layer
-        # bert_embeddings = bert_model.get_sequence_output()  # (batch_size, bert_max_seq_length, bert_embedding_size)
-        # mid layer(base 6, large 18)
-        bert_embeddings = bert_model.get_all_encoder_layers()[-7] # -1 : 12, -2 : 11, ..., -7 : 6
-                                                                  # -1 : 24, -2 : 23, ..., -7 : 18
-        # initialize pre-trained bert
+        # output of bert_layer(mid layer, base 6, large 18)
+        bert_embeddings = bert_model.get_sequence_output() # (batch_size, number of word pieces, bert_embedding_size)
+        # initialize pre-trained bert, only variables of the built layers are loaded.
         if self.is_training and self.bert_init_checkpoint:
             tvars = tf.trainable_variables()
             (assignment_map, initialized_variable_names) = modeling.get_assignment_map_from_checkpoint(tvars, self.bert_init_checkpoint)
@@ -368,6 +513,38 @@ class Model:
                 tf.logging.debug("  name = %s, shape = %s%s", var.name, var.shape, init_string)
         return bert_embeddings
 
+    def __align_bert_embeddings(self, bert_embeddings, wordidx2tokenidx):
+        """Align bert embeddings to words by mean-pooling word pieces, same as feed.align_bert_embeddings().
+        word i consists of tokens [wordidx2tokenidx[i], wordidx2tokenidx[i+1]),
+        the sum of them is computed from differences of cumulative sums.
+
+        Args:
+          bert_embeddings: (batch_size, number of word pieces, bert_dim)
+          wordidx2tokenidx: (batch_size, sentence_length+1 or less)
+        Returns:
+          (batch_size, sentence_length, bert_dim)
+        """
+        with tf.variable_scope('bert-align'):
+            batch_size = tf.shape(wordidx2tokenidx)[0]
+            sentence_length = self.sentence_length
+            # (batch_size, number of word pieces+1, bert_dim), csum[:, t] = sum(bert_embeddings[:, :t])
+            csum = tf.cumsum(bert_embeddings, axis=1)
+            csum = tf.pad(csum, [[0, 0], [1, 0], [0, 0]])
+            # boundaries of each word, (batch_size, sentence_length+1)
+            pad_length = tf.maximum(0, sentence_length + 1 - tf.shape(wordidx2tokenidx)[1])
+            boundaries = tf.pad(wordidx2tokenidx, [[0, 0], [0, pad_length]])[:, :sentence_length+1]
+            begins = boundaries[:, :-1]
+            ends = boundaries[:, 1:]
+            counts = ends - begins
+            valid = tf.logical_and(ends > 0, counts > 0)
+            ends = tf.where(valid, ends, begins)
+            batch_idx = tf.tile(tf.expand_dims(tf.range(batch_size), 1), [1, sentence_length])
+            sums = tf.gather_nd(csum, tf.stack([batch_idx, ends], axis=-1)) - \
+                   tf.gather_nd(csum, tf.stack([batch_idx, begins], axis=-1))
+            counts = tf.to_float(tf.maximum(counts, 1))
+            aligned = sums / tf.expand_dims(counts, -1)
+            return aligned * tf.expand_dims(tf.to_float(valid), -1)
+
     def __pos_embedding(self, inputs, keep_prob=0.5, scope='pos-embedding'):
         """Computing pos embeddings.
         """
@@ -579,8 +756,8 @@ class Model:
                                                                              sequence_lengths=self.sentence_lengths)
             return tf.reduce_mean(-log_likelihood)
         else:
-            cross_entropy = self.output_data * tf.log(tf.nn.softmax(self.logits)) # (batch_size, sentence_length, class_size)
-            cross_entropy = -tf.reduce_sum(cross_entropy, reduction_indices=2)    # (batch_size, sentence_length)
+            cross_entropy = tf.nn.sparse_softmax_cross_entropy_with_logits(labels=self.output_data_indices,
+                                                                           logits=self.logits) # (batch_size, sentence_length)
             # masking
             cross_entropy *= tf.to_float(self.sentence_masks)
             cross_entropy = tf.reduce_sum(cross_entropy, reduction_indices=1)     # (batch_size)
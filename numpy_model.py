@@ -0,0 +1,242 @@
+from __future__ import print_function
+import numpy as np
+from featurizer import Featurizer
+
+def sigmoid(x):
+    # same as 1 / (1 + exp(-x)), without overflow.
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)
+
+def masked_conv1d_and_max(t, weights, kernel, bias):
+    """NumPy version of ops.masked_conv1d_and_max() with relu activation.
+
+    Args:
+      t: [N, word_length, chr_dim]
+      weights: [N, word_length], masks.
+      kernel: [kernel_size, chr_dim, filters], kernel of tf.layers.conv1d.
+      bias: [filters]
+    Returns:
+      [N, filters]
+    """
+    n, word_length, chr_dim = t.shape
+    kernel_size, _, filters = kernel.shape
+    weights = weights.astype(np.float32)[:, :, np.newaxis]
+    t = t * weights
+    # padding='same'
+    pad_left = (kernel_size - 1) // 2
+    pad_right = kernel_size - 1 - pad_left
+    t = np.pad(t, [(0, 0), (pad_left, pad_right), (0, 0)], mode='constant')
+    windows = np.concatenate([t[:, j:j+word_length] for j in range(kernel_size)], axis=-1) # (N, word_length, kernel_size*chr_dim)
+    t_conv = np.maximum(np.dot(windows, kernel.reshape(kernel_size * chr_dim, filters)) + bias, 0.0)
+    t_conv *= weights
+    # reduce max -- set to zero if all padded
+    t_conv += (1. - weights) * np.min(t_conv, axis=-2, keepdims=True)
+    return np.max(t_conv, axis=-2)
+
+def conv2d_and_max(t, weights, W, b):
+    """NumPy version of conv2d(VALID, full chr_dim width) and max-pooling of Model.__wordchr_embedding_conv2d().
+
+    Args:
+      t: [N, word_length, chr_dim]
+      weights: [N, word_length], masks.
+      W: [filter_size, chr_dim, 1, filters]
+      b: [filters]
+    Returns:
+      [N, filters]
+    """
+    n, word_length, chr_dim = t.shape
+    filter_size, _, _, filters = W.shape
+    t = t * weights.astype(np.float32)[:, :, np.newaxis]
+    num_positions = word_length - filter_size + 1
+    windows = np.concatenate([t[:, j:j+num_positions] for j in range(filter_size)], axis=-1) # (N, num_positions, filter_size*chr_dim)
+    h = np.maximum(np.dot(windows, W.reshape(filter_size * chr_dim, filters)) + b, 0.0)
+    return np.max(h, axis=-2)
+
+def lstm_block_fused(x, lengths, kernel, bias, forget_bias=1.0):
+    """NumPy version of LSTMBlockFusedCell(no peephole, no cell clip).
+    [i, ci, f, o] = [x, h] * kernel + bias, outputs after sequence lengths are zero.
+
+    Args:
+      x: [batch_size, sentence_length, input_dim]
+      lengths: [batch_size]
+      kernel: [input_dim + rnn_size, 4*rnn_size]
+      bias: [4*rnn_size]
+    Returns:
+      [batch_size, sentence_length, rnn_size]
+    """
+    batch_size, sentence_length, input_dim = x.shape
+    rnn_size = kernel.shape[1] // 4
+    # input projection of all time steps at once.
+    xw = np.dot(x, kernel[:input_dim]) + bias # (batch_size, sentence_length, 4*rnn_size)
+    kernel_h = kernel[input_dim:]
+    h = np.zeros([batch_size, rnn_size], dtype=np.float32)
+    c = np.zeros([batch_size, rnn_size], dtype=np.float32)
+    outputs = np.zeros([batch_size, sentence_length, rnn_size], dtype=np.float32)
+    for step in range(sentence_length):
+        z = xw[:, step] + np.dot(h, kernel_h)
+        i = sigmoid(z[:, :rnn_size])
+        ci = np.tanh(z[:, rnn_size:2*rnn_size])
+        f = sigmoid(z[:, 2*rnn_size:3*rnn_size] + forget_bias)
+        o = sigmoid(z[:, 3*rnn_size:])
+        c = ci * i + c * f
+        h = np.tanh(c) * o
+        outputs[:, step] = h
+    masks = np.arange(sentence_length)[np.newaxis, :] < lengths[:, np.newaxis]
+    return outputs * masks[:, :, np.newaxis]
+
+def reverse_sequence(x, lengths):
+    """NumPy version of tf.reverse_sequence(batch_axis=0, seq_axis=1).
+    """
+    sentence_length = x.shape[1]
+    steps = np.arange(sentence_length)[np.newaxis, :]
+    indices = np.where(steps < lengths[:, np.newaxis], lengths[:, np.newaxis] - 1 - steps, steps)
+    return x[np.arange(x.shape[0])[:, np.newaxis], indices]
+
+def viterbi_decode(logits, trans_params, lengths):
+    """Batched viterbi decoding, same as tf.contrib.crf.crf_decode().
+
+    Args:
+      logits: [batch_size, sentence_length, class_size]
+      trans_params: [class_size, class_size]
+      lengths: [batch_size]
+    Returns:
+      [batch_size, sentence_length], tags after sequence lengths are not meaningful.
+    """
+    batch_size, sentence_length, class_size = logits.shape
+    score = logits[:, 0]
+    backpointers = np.zeros([batch_size, sentence_length, class_size], dtype=np.int32)
+    identity = np.arange(class_size, dtype=np.int32)[np.newaxis, :]
+    for step in range(1, sentence_length):
+        # (batch_size, class_size(prev), class_size(next))
+        v = score[:, :, np.newaxis] + trans_params[np.newaxis]
+        best = np.argmax(v, axis=1).astype(np.int32)
+        new_score = np.max(v, axis=1) + logits[:, step]
+        # keep the score after sequence lengths, so that the last valid step is decoded.
+        valid = (step < lengths)[:, np.newaxis]
+        score = np.where(valid, new_score, score)
+        backpointers[:, step] = np.where(valid, best, identity)
+    tags = np.zeros([batch_size, sentence_length], dtype=np.int32)
+    tags[:, -1] = np.argmax(score, axis=-1)
+    batch_idx = np.arange(batch_size)
+    for step in range(sentence_length - 1, 0, -1):
+        tags[:, step-1] = backpointers[batch_idx, step, tags[:, step]]
+    return tags
+
+class NumpyModel:
+
+    def __init__(self, config, npz_path, featurizer=None):
+        """Forward pass of the glove model(word, char-cnn, pos, chk, fused bi-lstm, projection, crf) in NumPy.
+        weights are exported by inference/export_npz.py.
+
+        Args:
+          config: an instance of Config class, emb_class='glove'.
+          npz_path: path to exported weights(ex, ./exported/ner_model.npz).
+          featurizer: an instance of Featurizer, optional.
+        """
+        if config.emb_class != 'glove':
+            raise ValueError('NumpyModel supports emb_class=glove only, not %s' % config.emb_class)
+        if config.rnn_used and config.rnn_type != 'fused':
+            raise ValueError('NumpyModel supports rnn_type=fused only, not %s' % config.rnn_type)
+        if config.tf_used:
+            raise ValueError('NumpyModel does not support transformer layers')
+        self.config = config
+        if featurizer is None:
+            featurizer = Featurizer(config)
+        self.featurizer = featurizer
+        weights = np.load(npz_path)
+        self.weights = dict([(key, weights[key].astype(np.float32)) for key in weights.files])
+        for key in ['wrd_embeddings', 'p_embeddings', 'k_embeddings', 'projection_W', 'projection_b']:
+            if key not in self.weights:
+                raise ValueError('%s is not found in %s' % (key, npz_path))
+
+    def __wordchr_embedding(self, wordchr_ids):
+        """Compute character embeddings, (batch_size, sentence_length, filters).
+        """
+        config = self.config
+        batch_size, sentence_length, word_length = wordchr_ids.shape
+        t = wordchr_ids.reshape([-1, word_length])
+        masks = t != 0
+        if config.chr_conv_type == 'conv1d':
+            chr_embeddings = self.weights['conv1d_chr_embeddings']
+            outputs = masked_conv1d_and_max(chr_embeddings[t], masks, self.weights['conv1d_kernel'], self.weights['conv1d_bias'])
+        else:
+            chr_embeddings = self.weights['conv2d_chr_embeddings']
+            pooled_outputs = []
+            for filter_size in config.filter_sizes:
+                W = self.weights['conv2d_W_%s' % filter_size]
+                b = self.weights['conv2d_b_%s' % filter_size]
+                pooled_outputs.append(conv2d_and_max(chr_embeddings[t], masks, W, b))
+            outputs = np.concatenate(pooled_outputs, axis=-1)
+        return outputs.reshape([batch_size, sentence_length, -1])
+
+    def __highway(self, x):
+        """NumPy version of ops.highway(), bias=-2.0, relu.
+        """
+        idx = 0
+        while 'highway_lin_Matrix_%s' % idx in self.weights:
+            g = np.maximum(np.dot(x, self.weights['highway_lin_Matrix_%s' % idx].T) + self.weights['highway_lin_Bias_%s' % idx], 0.0)
+            t = sigmoid(np.dot(x, self.weights['highway_gate_Matrix_%s' % idx].T) + self.weights['highway_gate_Bias_%s' % idx] - 2.0)
+            x = t * g + (1. - t) * x
+            idx += 1
+        return x
+
+    def forward(self, example):
+        """Compute logits.
+
+        Args:
+          example: dict of input arrays from Featurizer.featurize().
+        Returns:
+          logits: [batch_size, sentence_length, class_size]
+          sentence_lengths: [batch_size]
+        """
+        config = self.config
+        w = self.weights
+        sentence_masks = example['pos_ids'] != 0
+        sentence_lengths = np.sum(sentence_masks, axis=1).astype(np.int32)
+        masks = sentence_masks.astype(np.float32)[:, :, np.newaxis]
+        word_embeddings = w['wrd_embeddings'][example['word_ids']]
+        wordchr_embeddings = self.__wordchr_embedding(example['wordchr_ids'])
+        pos_embeddings = w['p_embeddings'][example['pos_ids']] * masks
+        chk_embeddings = w['k_embeddings'][example['chk_ids']] * masks
+        x = np.concatenate([word_embeddings, wordchr_embeddings, pos_embeddings, chk_embeddings], axis=-1)
+        if config.highway_used:
+            x = self.__highway(x)
+        x *= masks
+        if config.rnn_used:
+            for i in range(config.rnn_num_layers):
+                output_fw = lstm_block_fused(x, sentence_lengths, w['lstm_fw_kernel_%s' % i], w['lstm_fw_bias_%s' % i])
+                x_bw = reverse_sequence(x, sentence_lengths)
+                output_bw = lstm_block_fused(x_bw, sentence_lengths, w['lstm_bw_kernel_%s' % i], w['lstm_bw_bias_%s' % i])
+                output_bw = reverse_sequence(output_bw, sentence_lengths)
+                output = np.concatenate([output_fw, output_bw], axis=-1)
+                # residual
+                if i != 0: output += x
+                x = output
+        logits = np.dot(x, w['projection_W']) + w['projection_b']
+        return logits, sentence_lengths
+
+    def predict(self, buckets):
+        """Predict tags of buckets, same outputs as Predictor.predict().
+
+        Returns:
+          logits_indices: [batch_size, sentence_length]
+          sentence_lengths: [batch_size]
+        """
+        example = self.featurizer.featurize(buckets)
+        logits, sentence_lengths = self.forward(example)
+        if self.config.use_crf:
+            logits_indices = viterbi_decode(logits, self.weights['trans_params'], sentence_lengths)
+        else:
+            logits_indices = np.argmax(logits, axis=-1).astype(np.int32)
+        return logits_indices, sentence_lengths
+
+    def tag(self, buckets, batch_size=128):
+        """Tag buckets by length-sorted padded batches, same as Predictor.tag().
+        """
+        order = sorted(range(len(buckets)), key=lambda i: len(buckets[i]))
+        tags_list = [None] * len(buckets)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start+batch_size]
+            logits_indices, sentence_lengths = self.predict([buckets[i] for i in indices])
+            for b, i in enumerate(indices):
+                tags_list[i] = self.config.logit_indices_to_tags(logits_indices[b], sentence_lengths[b])
+        return tags_list
@@ -0,0 +1,81 @@
+from __future__ import print_function
+import sys
+import threading
+try: import queue
+except ImportError: import Queue as queue
+
+# end of stream marker.
+_END = object()
+
+class _Error:
+
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+class Pipeline:
+
+    def __init__(self, source, stages, queue_size=4):
+        """Run stages on items of source in threads connected by bounded queues.
+        each stage is a single thread, so outputs keep the order of source,
+        and a full queue blocks the previous stage(backpressure).
+        tensorflow releases the GIL in sess.run, so python stages overlap with it.
+
+        Args:
+          source: iterable of items, ex) generator of buckets.
+          stages: list of functions, each takes the output of the previous one.
+          queue_size: maximum number of items waiting between stages.
+        """
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+        self.threads = [threading.Thread(target=self.__read, args=(source, self.queues[0]))]
+        for i, stage in enumerate(stages):
+            self.threads.append(threading.Thread(target=self.__run, args=(stage, self.queues[i], self.queues[i+1])))
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def __read(self, source, out_queue):
+        try:
+            for item in source:
+                out_queue.put(item)
+        except Exception:
+            out_queue.put(_Error(sys.exc_info()))
+        out_queue.put(_END)
+
+    def __run(self, stage, in_queue, out_queue):
+        while True:
+            item = in_queue.get()
+            if item is _END or isinstance(item, _Error):
+                out_queue.put(item)
+                if item is _END: break
+                continue
+            try:
+                out_queue.put(stage(item))
+            except Exception:
+                out_queue.put(_Error(sys.exc_info()))
+
+    def __iter__(self):
+        """Iterate outputs of the last stage, in the order of source.
+        an exception raised in a stage is re-raised here.
+        """
+        out_queue = self.queues[-1]
+        while True:
+            item = out_queue.get()
+            if item is _END: break
+            if isinstance(item, _Error):
+                raise item.exc_info[1]
+            yield item
+
+def read_buckets(f):
+    """Read buckets(sentences separated by blank lines) from a CoNLL stream.
+    """
+    bucket = []
+    while 1:
+        line = f.readline()
+        if not line: break
+        line = line.strip()
+        if line:
+            bucket.append(line)
+            continue
+        if bucket: yield bucket
+        bucket = []
+    if bucket: yield bucket
@@ -0,0 +1,137 @@
+from __future__ import print_function
+import sys
+import tensorflow as tf
+# for LSTMBlockFusedCell(), https://github.com/tensorflow/tensorflow/issues/23369
+tf.contrib.rnn
+# for QRNN
+try: import qrnn
+except: sys.stderr.write('import qrnn, failed\n')
+from featurizer import Featurizer, BufferArena
+
+class Predictor:
+
+    def __init__(self, config, frozen_path, featurizer=None, session_conf=None, prefix='prefix'):
+        """Load a frozen graph once and run it via a compiled callable.
+
+        Args:
+          config: an instance of Config class.
+          frozen_path: path to frozen graph(ex, ./exported/ner_frozen.pb).
+          featurizer: an instance of Featurizer, optional. by default, a featurizer with BufferArena.
+          session_conf: tf.ConfigProto, optional.
+          prefix: name prefix of the imported graph.
+        """
+        self.config = config
+        if featurizer is None:
+            featurizer = Featurizer(config, arena=BufferArena())
+        self.featurizer = featurizer
+        self.graph = self.load_frozen_graph(frozen_path, prefix=prefix)
+        if session_conf is None:
+            session_conf = tf.ConfigProto(allow_soft_placement=True,
+                                          log_device_placement=False,
+                                          gpu_options=tf.GPUOptions(),
+                                          inter_op_parallelism_threads=0,
+                                          intra_op_parallelism_threads=0)
+        self.sess = tf.Session(graph=self.graph, config=session_conf)
+
+        # mapping input tensors(key of featurizer example, placeholder name) for emb_class.
+        inputs = [('is_train', 'is_train'),
+                  ('sentence_length', 'sentence_length'),
+                  ('word_ids', 'input_data_word_ids'),
+                  ('wordchr_ids', 'input_data_wordchr_ids'),
+                  ('pos_ids', 'input_data_pos_ids'),
+                  ('chk_ids', 'input_data_chk_ids'),
+                  ('form_ids', 'input_data_form_ids')]
+        if 'elmo' in config.emb_class:
+            inputs.append(('elmo_wordchr_ids', 'elmo_input_data_wordchr_ids'))
+        if 'bert' in config.emb_class:
+            inputs.append(('bert_token_ids', 'bert_input_data_token_ids'))
+            inputs.append(('bert_token_masks', 'bert_input_data_token_masks'))
+            inputs.append(('bert_segment_ids', 'bert_input_data_segment_ids'))
+            inputs.append(('bert_wordidx2tokenidx', 'bert_input_data_wordidx2tokenidx'))
+        self.input_keys = []
+        feed_list = []
+        for key, name in inputs:
+            # some of input tensors might not exist in the frozen graph.
+            # ex) 'input_data_chk_ids', 'is_train'(folded by freeze.py --optimize_for_inference)
+            tensor = self.__get_tensor(prefix, name)
+            if tensor is None: continue
+            self.input_keys.append(key)
+            feed_list.append(tensor)
+        if 'form_ids' in self.input_keys and config.form_vocab is None:
+            raise ValueError('%s caches word forms, load the form table by Config.load_form_table()' % frozen_path)
+        # mapping output tensors
+        fetches = [self.__get_tensor(prefix, 'logits_indices'), self.__get_tensor(prefix, 'sentence_lengths')]
+        self.runner = self.sess.make_callable(fetches, feed_list=feed_list)
+
+    @staticmethod
+    def load_frozen_graph(frozen_graph_filename, prefix='prefix'):
+        with tf.gfile.GFile(frozen_graph_filename, "rb") as f:
+            graph_def = tf.GraphDef()
+            graph_def.ParseFromString(f.read())
+        with tf.Graph().as_default() as graph:
+            tf.import_graph_def(
+                graph_def,
+                input_map=None,
+                return_elements=None,
+                op_dict=None,
+                producer_op_list=None,
+                name=prefix,
+            )
+        return graph
+
+    def __get_tensor(self, prefix, name):
+        try: return self.graph.get_tensor_by_name(prefix + '/' + name + ':0')
+        except KeyError: return None
+
+    def predict(self, buckets):
+        """Predict tags of buckets(a single sentence or a padded batch).
+
+        Args:
+          buckets: list of bucket, a bucket is a list of 'word pos chk tag' lines.
+        Returns:
+          logits_indices: [batch_size, sentence_length]
+          sentence_lengths: [batch_size]
+        """
+        return self.run(self.featurize(buckets))
+
+    def featurize(self, buckets):
+        """Build arguments of the compiled callable for buckets.
+        to featurize the next buckets while running the current ones(see pipeline.py),
+        the featurizer must not have a BufferArena.
+        """
+        example = self.featurizer.featurize(buckets)
+        example['is_train'] = False
+        example['sentence_length'] = example['word_ids'].shape[1]
+        return [example[key] for key in self.input_keys]
+
+    def run(self, args):
+        """Run the compiled callable with arguments from featurize().
+
+        Returns:
+          logits_indices: [batch_size, sentence_length]
+          sentence_lengths: [batch_size]
+        """
+        logits_indices, sentence_lengths = self.runner(*args)
+        return logits_indices, sentence_lengths
+
+    def tag(self, buckets, batch_size=128):
+        """Tag buckets by length-sorted padded batches.
+
+        Args:
+          buckets: list of bucket.
+          batch_size: number of buckets per batch.
+        Returns:
+          list of tag sequence, in the order of buckets.
+        """
+        # sort by length so that each batch is padded to a similar length.
+        order = sorted(range(len(buckets)), key=lambda i: len(buckets[i]))
+        tags_list = [None] * len(buckets)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start+batch_size]
+            logits_indices, sentence_lengths = self.predict([buckets[i] for i in indices])
+            for b, i in enumerate(indices):
+                tags_list[i] = self.config.logit_indices_to_tags(logits_indices[b], sentence_lengths[b])
+        return tags_list
+
+    def close(self):
+        self.sess.close()
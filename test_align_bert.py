@@ -0,0 +1,38 @@
+"""feed.align_bert_embeddings() must mean-pool word pieces of each word like a plain python loop,
+for words of several pieces, truncated sentences and padded rows.
+"""
+from __future__ import print_function
+import argparse
+import numpy as np
+from feed import align_bert_embeddings
+
+def mean_pooling(embeddings, boundaries, sentence_length):
+    """Mean-pool word pieces of each word one by one.
+    """
+    out = np.zeros([sentence_length, embeddings.shape[-1]], dtype=np.float32)
+    for k in range(min(len(boundaries) - 1, sentence_length)):
+        begin, end = boundaries[k], boundaries[k+1]
+        if end == 0: break
+        if end > begin: out[k] = np.mean(embeddings[begin:end], axis=0)
+    return out
+
+def test_align_bert_embeddings():
+    rng = np.random.RandomState(0)
+    config = argparse.Namespace(bert_max_seq_length=12)
+    batch_size, seq_length, bert_dim = 4, 12, 5
+    bert_embeddings = rng.randn(1, batch_size, seq_length, bert_dim).astype(np.float32)
+    # [CLS] is the 0-th piece, followed by words of 1 ~ 3 pieces, zero padded.
+    bert_wordidx2tokenidx = np.array([[1, 3, 4, 5, 7, 9, 0, 0, 0, 0, 0, 0],
+                                      [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12],
+                                      [1, 4, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+                                      [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]], dtype=np.int32)
+    for sentence_length in [12, 6, 3]:
+        out = align_bert_embeddings(config, bert_embeddings, bert_wordidx2tokenidx, 1, sentence_length=sentence_length)
+        assert out.shape == (batch_size, sentence_length, bert_dim)
+        for b in range(batch_size):
+            expected = mean_pooling(bert_embeddings[0, b], bert_wordidx2tokenidx[b], sentence_length)
+            assert np.allclose(out[b], expected, atol=1e-6)
+
+if __name__ == '__main__':
+    test_align_bert_embeddings()
+    print('align_bert_embeddings == mean pooling ... ok')
@@ -0,0 +1,54 @@
+"""ElmoCharTable must encode sentences of a data file exactly like bilm Batcher,
+including unseen, overlong and multi-byte words.
+
+usage: python test_elmo_chars.py --vocab_file embeddings/elmo_vocab.txt --data_path data/test.txt
+"""
+from __future__ import print_function
+import sys
+import argparse
+import numpy as np
+from bilm import Batcher
+from elmo_chars import ElmoCharTable
+
+def read_sentences(file_name):
+    sentences = []
+    words = []
+    for line in open(file_name):
+        tokens = line.split()
+        if not tokens:
+            if words: sentences.append(words)
+            words = []
+            continue
+        words.append(tokens[0])
+    if words: sentences.append(words)
+    return sentences
+
+def check(vocab_file, sentences, batch_size=32, word_length=50):
+    """Compare ElmoCharTable with bilm Batcher for every sentence.
+    """
+    batcher = Batcher(vocab_file, word_length)
+    table = ElmoCharTable(vocab_file, word_length)
+    # unseen words(fallback encoding), long words(truncated), multi-byte characters.
+    sentences = sentences + [['etaggerUnseenWord', 'x' * (word_length * 2), u'안녕', '<S>', '</S>']]
+    num_words = 0
+    for begin in range(0, len(sentences), batch_size):
+        batch = sentences[begin:begin+batch_size]
+        expected = batcher.batch_sentences(batch) # (batch_size, max sentence length + 2, word_length)
+        max_sentence_length = expected.shape[1] - 2
+        for i, words in enumerate(batch):
+            out = table.encode_sentence(words, max_sentence_length)
+            if not np.array_equal(out, expected[i]):
+                raise AssertionError('mismatch : %s' % ' '.join(words))
+            num_words += len(words)
+    return num_words
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vocab_file', type=str, default='embeddings/elmo_vocab.txt', help='path to elmo vocab file')
+    parser.add_argument('--data_path', type=str, default='data/test.txt', help='path to data file')
+
+    args = parser.parse_args()
+
+    sentences = read_sentences(args.data_path)
+    num_words = check(args.vocab_file, sentences)
+    sys.stderr.write('ElmoCharTable == bilm Batcher for %s sentences, %s words ... ok\n' % (len(sentences), num_words))
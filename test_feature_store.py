@@ -0,0 +1,52 @@
+"""FeatureStore round trip: examples put out of order are read back by get() and lookup(),
+and an example which was never put raises ValueError.
+"""
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import numpy as np
+from feature_store import FeatureStore
+
+def test_round_trip():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'bert_features')
+        feature_shape = [4, 3]
+        rng = np.random.RandomState(0)
+        features = {}
+        # put out of order, example 3 is never put.
+        for ex_index, length in [(2, 5), (0, 1), (4, 7), (1, 3)]:
+            features[ex_index] = rng.randn(length, *feature_shape).astype(np.float16)
+        assert not FeatureStore.exists(path)
+        store = FeatureStore(path, feature_shape=feature_shape, mode='w')
+        for ex_index, feature in features.items():
+            store.put(ex_index, feature)
+        store.close()
+        assert FeatureStore.exists(path)
+
+        store = FeatureStore(path)
+        for ex_index, feature in features.items():
+            assert np.array_equal(store.get(ex_index), feature)
+        # padded with zeros, truncated to max_length.
+        out = store.lookup([1, 4, 0], 5)
+        assert out.shape == (3, 5, 4, 3)
+        assert out.dtype == np.float32
+        assert np.array_equal(out[0, :3], features[1].astype(np.float32))
+        assert not np.any(out[0, 3:])
+        assert np.array_equal(out[1], features[4][:5].astype(np.float32))
+        assert np.array_equal(out[2, :1], features[0].astype(np.float32))
+        assert not np.any(out[2, 1:])
+        # examples which were never put.
+        for ex_index in [3, 5, -1]:
+            try:
+                store.lookup([0, ex_index], 5)
+            except ValueError:
+                continue
+            raise AssertionError('example %s should not be found' % ex_index)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    test_round_trip()
+    print('FeatureStore round trip ... ok')
@@ -0,0 +1,86 @@
+"""Featurizer must produce the same inputs as Input(bucket, config, build_output=False).example,
+for a bucket alone, in padded batches and with reused BufferArena buffers.
+
+usage: python test_featurizer.py --emb_path embeddings/glove.6B.100d.txt.pkl --wrd_dim 100 --emb_class glove
+"""
+from __future__ import print_function
+import sys
+import argparse
+import numpy as np
+from embvec import EmbVec
+from config import Config
+from input import Input
+from featurizer import Featurizer, BufferArena
+from pipeline import read_buckets
+
+def pad_value(config, key):
+    embvec = config.embvec
+    if key == 'word_ids': return embvec.pad_wid
+    if key == 'wordchr_ids': return embvec.pad_cid
+    if key == 'pos_ids': return embvec.pad_pid
+    if key == 'chk_ids': return embvec.pad_kid
+    return 0
+
+def assert_same(config, key, out, expected):
+    """Compare along the sentence axis, the longer one must be padded after the common length.
+    """
+    out = np.asarray(out)
+    expected = np.asarray(expected)
+    length = min(len(out), len(expected))
+    if not np.array_equal(out[:length], expected[:length]):
+        raise AssertionError('%s mismatch : %s != %s' % (key, out.tolist(), expected.tolist()))
+    pad = pad_value(config, key)
+    if np.any(out[length:] != pad) or np.any(expected[length:] != pad):
+        raise AssertionError('%s padding mismatch : %s != %s' % (key, out.tolist(), expected.tolist()))
+
+def check_bucket(config, featurizer, bucket):
+    """Featurizer output of a bucket must be the same as Input(bucket, build_output=False).example.
+    """
+    example = featurizer.featurize([bucket])
+    inp = Input(bucket, config, build_output=False)
+    for key, val in inp.example.items():
+        assert_same(config, key, example[key][0], val[0])
+    return example
+
+def check_batch(config, featurizer, buckets, singles):
+    """Each row of a padded batch must be the same as the bucket featurized alone.
+    """
+    example = featurizer.featurize(buckets)
+    for b, single in enumerate(singles):
+        for key, val in single.items():
+            assert_same(config, key, example[key][b], val[0])
+
+def check_arena(config, arena_featurizer, buckets, singles):
+    """Reused buffers must not leak values of the previous batch.
+    """
+    for begin in range(len(buckets)):
+        example = arena_featurizer.featurize([buckets[begin]])
+        for key, val in singles[begin].items():
+            assert_same(config, key, example[key][0], val[0])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--emb_path', type=str, help='path to word embedding vector + vocab(.pkl)', required=True)
+    parser.add_argument('--wrd_dim', type=int, help='dimension of word embedding vector', required=True)
+    parser.add_argument('--word_length', type=int, default=15, help='max word length')
+    parser.add_argument('--emb_class', type=str, default='glove', help='class of embedding(glove, elmo, bert, bert+elmo)')
+    parser.add_argument('--data_path', type=str, default='data/test.txt', help='path to data file')
+    parser.add_argument('--batch_size', type=int, default=32, help='number of buckets per batch')
+
+    args = parser.parse_args()
+    args.restore = None
+
+    config = Config(args, is_training=False, emb_class=args.emb_class, use_crf=True)
+    featurizer = Featurizer(config)
+    arena_featurizer = Featurizer(config, arena=BufferArena())
+    buckets = list(read_buckets(open(args.data_path)))
+    num_buckets = 0
+    for begin in range(0, len(buckets), args.batch_size):
+        batch = buckets[begin:begin+args.batch_size]
+        singles = [check_bucket(config, featurizer, bucket) for bucket in batch]
+        check_batch(config, featurizer, batch, singles)
+        # longest first, so that shorter ones are written over longer ones in the same buffer.
+        order = sorted(range(len(batch)), key=lambda i: -len(batch[i]))
+        check_arena(config, arena_featurizer, [batch[i] for i in order], [singles[i] for i in order])
+        num_buckets += len(batch)
+    sys.stderr.write('Featurizer == Input.example for %s buckets ... ok\n' % (num_buckets))
@@ -0,0 +1,160 @@
+"""NumpyModel must decode like the tensorflow model: viterbi_decode() is checked against brute force,
+and, with tensorflow 1.x, against crf_decode and a random glove BiLSTM-CRF exported by export_npz.
+
+usage: python test_numpy_model.py --data_path data/test.txt
+"""
+from __future__ import print_function
+import sys
+import os
+import shutil
+import tempfile
+import argparse
+import itertools
+import pickle as pkl
+import numpy as np
+from numpy_model import NumpyModel, viterbi_decode
+from pipeline import read_buckets
+# tensorflow(1.x, tf.contrib) is imported only in check_*(), which are run from main.
+# test_*() need numpy only.
+
+def brute_force_decode(logits, trans_params, length):
+    """Best tag sequence of a sentence by enumerating every sequence.
+    """
+    class_size = logits.shape[-1]
+    best_score = None
+    best_tags = None
+    for tags in itertools.product(range(class_size), repeat=length):
+        score = logits[0, tags[0]]
+        for step in range(1, length):
+            score += trans_params[tags[step-1], tags[step]] + logits[step, tags[step]]
+        if best_score is None or score > best_score:
+            best_score = score
+            best_tags = list(tags)
+    return best_tags
+
+def random_crf_inputs(rng, batch_size=16, sentence_length=6, class_size=4):
+    logits = rng.randn(batch_size, sentence_length, class_size).astype(np.float32)
+    trans_params = rng.randn(class_size, class_size).astype(np.float32)
+    lengths = rng.randint(1, sentence_length + 1, size=[batch_size]).astype(np.int32)
+    lengths[0] = sentence_length
+    return logits, trans_params, lengths
+
+def test_viterbi_decode():
+    rng = np.random.RandomState(0)
+    for _ in range(10):
+        logits, trans_params, lengths = random_crf_inputs(rng)
+        tags = viterbi_decode(logits, trans_params, lengths)
+        for b, length in enumerate(lengths):
+            assert tags[b, :length].tolist() == brute_force_decode(logits[b], trans_params, length)
+
+def check_viterbi_decode_tf():
+    import tensorflow as tf
+    rng = np.random.RandomState(1)
+    with tf.Graph().as_default():
+        p_logits = tf.placeholder(tf.float32, shape=[None, None, None])
+        p_trans_params = tf.placeholder(tf.float32, shape=[None, None])
+        p_lengths = tf.placeholder(tf.int32, shape=[None])
+        decode_tags, _ = tf.contrib.crf.crf_decode(p_logits, p_trans_params, p_lengths)
+        with tf.Session() as sess:
+            for sentence_length, class_size in [(1, 3), (7, 5), (40, 9)]:
+                logits, trans_params, lengths = random_crf_inputs(rng, batch_size=64,
+                                                                  sentence_length=sentence_length,
+                                                                  class_size=class_size)
+                expected = sess.run(decode_tags, feed_dict={p_logits: logits, p_trans_params: trans_params, p_lengths: lengths})
+                tags = viterbi_decode(logits, trans_params, lengths)
+                for b, length in enumerate(lengths):
+                    assert tags[b, :length].tolist() == expected[b, :length].tolist()
+
+def build_embvec(tmp_dir, data_path, num_sentences, wrd_dim):
+    """Build a small EmbVec from sentences of data_path and random word vectors.
+    """
+    from embvec import EmbVec
+    rng = np.random.RandomState(2)
+    with open(data_path) as f:
+        buckets = list(read_buckets(f))[:num_sentences]
+    total_path = os.path.join(tmp_dir, 'total.txt')
+    with open(total_path, 'w') as f:
+        for bucket in buckets:
+            f.write('\n'.join(bucket) + '\n\n')
+    words = sorted(set([line.split()[0].lower() for bucket in buckets for line in bucket]))
+    glove_path = os.path.join(tmp_dir, 'glove.txt')
+    with open(glove_path, 'w') as f:
+        # every 5th word is left out for unknown words.
+        for i, word in enumerate(words):
+            if i % 5 == 0: continue
+            f.write(word + ' ' + ' '.join(['%.4f' % v for v in rng.randn(wrd_dim)]) + '\n')
+    args = argparse.Namespace(emb_path=glove_path, wrd_dim=wrd_dim, train_path=total_path, total_path=total_path,
+                              lowercase='True', elmo_vocab_path='', elmo_options_path='', elmo_weight_path='',
+                              bert_config_path='', bert_vocab_path='', bert_do_lower_case='False',
+                              bert_init_checkpoint='', bert_max_seq_length=180, bert_dim=1024)
+    embvec = EmbVec(args)
+    emb_path = glove_path + '.pkl'
+    pkl.dump(embvec, open(emb_path, 'wb'))
+    return emb_path, buckets
+
+def check_model(emb_path, wrd_dim, buckets, npz_path, chr_conv_type, highway_used):
+    """Build a random glove BiLSTM-CRF, export its weights and compare tags of NumpyModel with those of tensorflow.
+    """
+    import tensorflow as tf
+    from config import Config
+    from model import Model
+    from featurizer import Featurizer
+    import feed
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inference'))
+    from export_npz import build_weights
+
+    args = argparse.Namespace(emb_path=emb_path, wrd_dim=wrd_dim, word_length=15, restore=None)
+    config = Config(args, is_training=False, emb_class='glove', use_crf=True)
+    config.chr_conv_type = chr_conv_type
+    config.highway_used = highway_used
+    featurizer = Featurizer(config)
+    with tf.Graph().as_default():
+        model = Model(config)
+        sess = tf.Session()
+        sess.run(tf.global_variables_initializer(), feed_dict={model.wrd_embeddings_init: config.embvec.wrd_embeddings})
+        # scale up projection and transitions, so that decoding does not depend on near ties.
+        rng = np.random.RandomState(3)
+        for v in tf.global_variables():
+            if v.op.name.startswith('projection/') or v.op.name == 'trans_params':
+                v.load(rng.randn(*v.get_shape().as_list()).astype(np.float32), sess)
+        model.sess = sess
+        values = dict([(v.op.name, sess.run(v)) for v in tf.global_variables()])
+        np.savez(npz_path, **build_weights(values))
+
+        np_model = NumpyModel(config, npz_path, featurizer=featurizer)
+        batch_size = 16
+        for begin in range(0, len(buckets), batch_size):
+            batch = buckets[begin:begin+batch_size]
+            feed_dict = feed.build_batch_input_feed_dict(model, batch, featurizer)
+            logits, logits_indices, sentence_lengths = sess.run([model.logits, model.logits_indices, model.sentence_lengths], feed_dict=feed_dict)
+            np_logits, np_sentence_lengths = np_model.forward(featurizer.featurize(batch))
+            np_logits_indices, _ = np_model.predict(batch)
+            assert np.array_equal(np_sentence_lengths, sentence_lengths)
+            for b, length in enumerate(sentence_lengths):
+                assert np.allclose(np_logits[b, :length], logits[b, :length], atol=1e-4)
+                assert np_logits_indices[b, :length].tolist() == logits_indices[b, :length].tolist()
+        sess.close()
+
+def check_numpy_model(data_path, num_sentences, wrd_dim=16):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        emb_path, buckets = build_embvec(tmp_dir, data_path, num_sentences, wrd_dim)
+        npz_path = os.path.join(tmp_dir, 'ner_model.npz')
+        for chr_conv_type, highway_used in [('conv1d', False), ('conv2d', True)]:
+            check_model(emb_path, wrd_dim, buckets, npz_path, chr_conv_type, highway_used)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data_path', type=str, default='data/test.txt', help='path to data file')
+    parser.add_argument('--num_sentences', type=int, default=100, help='number of sentences to compare')
+
+    args = parser.parse_args()
+
+    test_viterbi_decode()
+    sys.stderr.write('viterbi_decode == brute force ... ok\n')
+    check_viterbi_decode_tf()
+    sys.stderr.write('viterbi_decode == crf_decode ... ok\n')
+    check_numpy_model(args.data_path, args.num_sentences)
+    sys.stderr.write('NumpyModel == tensorflow model ... ok\n')
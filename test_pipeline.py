@@ -0,0 +1,77 @@
+"""Pipeline keeps the order of its source, blocks the source when a stage is slow,
+and re-raises errors of a stage or of the source to the consumer.
+"""
+from __future__ import print_function
+import time
+import random
+import threading
+from pipeline import Pipeline, read_buckets
+try: from StringIO import StringIO
+except ImportError: from io import StringIO
+
+def test_order():
+    rng = random.Random(0)
+    def stage(x):
+        # random delays must not change the order of outputs.
+        time.sleep(rng.random() * 0.002)
+        return x
+    pipeline = Pipeline(range(200), [stage, lambda x: x * 2, stage], queue_size=2)
+    assert list(pipeline) == [x * 2 for x in range(200)]
+
+def test_backpressure():
+    produced = []
+    def source():
+        for x in range(100):
+            produced.append(x)
+            yield x
+    release = threading.Event()
+    def stage(x):
+        release.wait()
+        return x
+    pipeline = Pipeline(source(), [stage], queue_size=2)
+    time.sleep(0.1)
+    # source is blocked by the bounded queues while the stage waits.
+    assert len(produced) < 10
+    release.set()
+    assert list(pipeline) == list(range(100))
+
+def test_stage_error():
+    def stage(x):
+        if x == 3: raise ValueError('bad item %s' % x)
+        return x
+    outputs = []
+    try:
+        for out in Pipeline(range(10), [stage, lambda x: x]):
+            outputs.append(out)
+    except ValueError as e:
+        assert str(e) == 'bad item 3'
+    else:
+        raise AssertionError('error of a stage should be raised')
+    assert outputs == [0, 1, 2]
+
+def test_source_error():
+    def source():
+        yield 0
+        yield 1
+        raise IOError('broken source')
+    outputs = []
+    try:
+        for out in Pipeline(source(), [lambda x: x]):
+            outputs.append(out)
+    except IOError as e:
+        assert str(e) == 'broken source'
+    else:
+        raise AssertionError('error of source should be raised')
+    assert outputs == [0, 1]
+
+def test_read_buckets():
+    f = StringIO('a B C O\nb B C O\n\n \n\nc B C O\n')
+    assert list(read_buckets(f)) == [['a B C O', 'b B C O'], ['c B C O']]
+
+if __name__ == '__main__':
+    test_order()
+    test_backpressure()
+    test_stage_error()
+    test_source_error()
+    test_read_buckets()
+    print('Pipeline ordering, backpressure and error propagation ... ok')
@@ -5,6 +5,7 @@ import time
 import argparse
 import tensorflow as tf
 import numpy as np
+import hashlib
 from embvec import EmbVec
 from config import Config
 from model import Model
@@ -14,53 +15,108 @@ from token_eval  import TokenEval
 from chunk_eval  import ChunkEval
 from progbar import Progbar
 from early_stopping import EarlyStopping
+from feature_store import FeatureStore
 
-def train_step(model, data, summary_op, summary_writer):
+def build_feature_store(model, data, init_op, next_element, name, key, feature_shape, compute):
+    """Compute word-level features of data once and store them as float16, keyed by example index.
+
+    Args:
+      name: name of features, ex) 'bert', 'elmo'.
+      key: identifier of the pre-trained model which computes features, ex) digest of weight files.
+      feature_shape: shape of a word-level feature.
+      compute: function(dataset, feed_dict, idx) returning features, [batch_size, sentence_length] + feature_shape.
+    """
+    key = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+    path = os.path.join(data.cache_dir, name + '_features-' + key)
+    if not FeatureStore.exists(path):
+        tf.logging.debug('building %s feature store : %s' % (name, path))
+        store = FeatureStore(path, feature_shape=feature_shape, mode='w')
+        prog = Progbar(target=data.num_batches)
+        model.sess.run(init_op)
+        # data.num_batches is an estimate, read until the end of data so that every example is stored.
+        idx = 0
+        while True:
+            try:
+                dataset = model.sess.run(next_element)
+            except tf.errors.OutOfRangeError:
+                break
+            feed_dict = feed.build_feed_dict(model, dataset, False)
+            features = np.asarray(compute(dataset, feed_dict, idx), dtype=np.float16)
+            lengths = np.sum(np.sign(dataset['pos_ids']), axis=1)
+            for ex_index, feature, length in zip(dataset['ex_index'], features, lengths):
+                store.put(int(ex_index), feature[:length])
+            idx += 1
+            prog.update(min(idx, data.num_batches))
+        store.close()
+    return FeatureStore(path)
+
+def build_bert_feature_store(model, data, init_op, next_element):
+    """Build feature store of aligned bert embeddings.
+    bert weights are not updated during training, so the embeddings can be reused in every epoch.
+    """
+    config = model.config
+    def compute(dataset, feed_dict, idx):
+        return model.sess.run(model.bert_embeddings, feed_dict=feed_dict)
+    # '.index' of a checkpoint holds checksums of every tensor, so its digest identifies the weights.
+    key = Input.file_digest(config.bert_init_checkpoint + '.index') + ':%s' % config.bert_layer
+    return build_feature_store(model, data, init_op, next_element, 'bert',
+                               key,
+                               [config.bert_dim],
+                               compute)
+
+def build_elmo_feature_store(model, data, init_op, next_element):
+    """Build feature store of biLM layer activations.
+    only the scalar mix of elmo is trainable, so the activations can be reused in every epoch.
+    """
+    config = model.config
+    shape = model.elmo_layers_subgraph.get_shape().as_list()
+    def compute(dataset, feed_dict, idx):
+        return model.sess.run(model.elmo_layers_subgraph, feed_dict=feed_dict)
+    key = Input.file_digest(config.embvec.elmo_options_path) + Input.file_digest(config.embvec.elmo_weight_path)
+    return build_feature_store(model, data, init_op, next_element, 'elmo',
+                               key,
+                               shape[2:],
+                               compute)
+
+def train_step(model, data, init_op, next_element, summary_op, summary_writer):
     """Train one epoch
     """
     start_time = time.time()
     sess = model.sess
     runopts = tf.RunOptions(report_tensor_allocations_upon_oom=True)
     prog = Progbar(target=data.num_batches)
-    iterator = data.dataset.make_initializable_iterator()
-    next_element = iterator.get_next()
-    sess.run(iterator.initializer)
-    for idx in range(data.num_batches):
-        try:
-            dataset = sess.run(next_element)
-        except tf.errors.OutOfRangeError:
-            break
-        feed_dict = feed.build_feed_dict(model, dataset, data.max_sentence_length, True)
-        if 'bert' in model.config.emb_class:
-            # compute bert embedding at runtime
-            bert_embeddings = sess.run([model.bert_embeddings_subgraph], feed_dict=feed_dict, options=runopts)
-            if idx == 0:
-                tf.logging.debug('# bert_token_ids')
-                t = dataset['bert_token_ids'][:1]
-                tf.logging.debug(' '.join([str(x) for x in np.shape(t)]))
-                tf.logging.debug(' '.join([str(x) for x in t]))
-                tf.logging.debug('# bert_token_masks')
-                t = dataset['bert_token_masks'][:1]
-                tf.logging.debug(' '.join([str(x) for x in np.shape(t)]))
-                tf.logging.debug(' '.join([str(x) for x in t]))
-                tf.logging.debug('# bert_wordidx2tokenidx')
-                t = dataset['bert_wordidx2tokenidx'][:1]
-                tf.logging.debug(' '.join([str(x) for x in np.shape(t)]))
-                tf.logging.debug(' '.join([str(x) for x in t]))
-            # update feed_dict
-            feed_dict[model.bert_embeddings] = feed.align_bert_embeddings(config, bert_embeddings, dataset['bert_wordidx2tokenidx'], idx)
-            step, summaries, _, loss, accuracy, f1, learning_rate = \
-                sess.run([model.global_step, summary_op, model.train_op, \
-                          model.loss, model.accuracy, model.f1, \
-                          model.learning_rate], feed_dict=feed_dict, options=runopts)
+    sess.run(init_op)
+    fetches = [model.global_step, summary_op, model.train_op, \
+               model.loss, model.accuracy, model.f1, \
+               model.learning_rate]
+    # data.num_batches is an estimate, read until the end of data so that every batch is trained.
+    idx = 0
+    while True:
+        if model.features is not None:
+            # input tensors come from the dataset iterator, single sess.run() per step.
+            try:
+                step, summaries, _, loss, accuracy, f1, learning_rate = \
+                    sess.run(fetches, feed_dict={model.is_train: True}, options=runopts)
+            except tf.errors.OutOfRangeError:
+                break
         else:
+            try:
+                dataset = sess.run(next_element)
+            except tf.errors.OutOfRangeError:
+                break
+            feed_dict = feed.build_feed_dict(model, dataset, True)
+            if 'elmo' in model.config.emb_class and data.elmo_feature_store is not None:
+                # read precomputed biLM layer activations
+                feed_dict[model.elmo_layers] = data.elmo_feature_store.lookup(dataset['ex_index'], np.shape(dataset['word_ids'])[1])
+            if 'bert' in model.config.emb_class and data.bert_feature_store is not None:
+                # read precomputed bert embeddings
+                feed_dict[model.bert_embeddings] = data.bert_feature_store.lookup(dataset['ex_index'], np.shape(dataset['word_ids'])[1])
             step, summaries, _, loss, accuracy, f1, learning_rate = \
-                sess.run([model.global_step, summary_op, model.train_op, \
-                          model.loss, model.accuracy, model.f1, \
-                          model.learning_rate], feed_dict=feed_dict, options=runopts)
+                sess.run(fetches, feed_dict=feed_dict, options=runopts)
 
         summary_writer.add_summary(summaries, step)
-        prog.update(idx + 1,
+        idx += 1
+        prog.update(min(idx, data.num_batches),
                     [('step', step),
                      ('train loss', loss),
                      ('train accuracy', accuracy),
@@ -70,12 +126,23 @@ def train_step(model, data, summary_op, summary_writer):
     out = '\nduration_time : ' + str(duration_time) + ' sec for this epoch'
     tf.logging.debug(out)
 
-def dev_step(model, data, summary_writer, epoch):
+def dev_step(model, data, init_op, next_element, summary_writer, epoch):
     """Evaluate dev data
     """
 
+    def np_pad(var, length):
+        if var.ndim < 2 or var.shape[1] >= length: return var
+        pad_width = [(0, 0), (0, length - var.shape[1])] + [(0, 0)] * (var.ndim - 2)
+        return np.pad(var, pad_width, 'constant')
+
     def np_concat(sum_var, var):
-        if sum_var is not None: sum_var = np.concatenate((sum_var, var), axis=0)
+        if sum_var is not None:
+            # batches may have different sentence length due to length-bucketing.
+            if var.ndim >= 2:
+                length = max(sum_var.shape[1], var.shape[1])
+                sum_var = np_pad(sum_var, length)
+                var = np_pad(var, length)
+            sum_var = np.concatenate((sum_var, var), axis=0)
         else: sum_var = var
         return sum_var
 
@@ -90,39 +157,51 @@ def dev_step(model, data, summary_writer, epoch):
     trans_params = None
     global_step = 0
     prog = Progbar(target=data.num_batches)
-    iterator = data.dataset.make_initializable_iterator()
-    next_element = iterator.get_next()
-    sess.run(iterator.initializer)
+    sess.run(init_op)
+    fetches = [model.global_step, model.logits_indices, model.sentence_lengths, \
+               model.loss, model.accuracy, model.f1, model.output_data_indices]
 
     # evaluate on dev data sliced by batch_size to prevent OOM(Out Of Memory).
-    for idx in range(data.num_batches):
-        try:
-            dataset = sess.run(next_element)
-        except tf.errors.OutOfRangeError:
-            break
-        feed_dict = feed.build_feed_dict(model, dataset, data.max_sentence_length, False)
-        if 'bert' in model.config.emb_class:
-            # compute bert embedding at runtime
-            bert_embeddings = sess.run([model.bert_embeddings_subgraph], feed_dict=feed_dict, options=runopts)
-            # update feed_dict
-            feed_dict[model.bert_embeddings] = feed.align_bert_embeddings(config, bert_embeddings, dataset['bert_wordidx2tokenidx'], idx)
-        global_step, logits_indices, sentence_lengths, loss, accuracy, f1 = \
-            sess.run([model.global_step, model.logits_indices, model.sentence_lengths, \
-                      model.loss, model.accuracy, model.f1], feed_dict=feed_dict)
-        prog.update(idx + 1,
+    # data.num_batches is an estimate, read until the end of data so that every example is evaluated.
+    idx = 0
+    while True:
+        if model.features is not None:
+            # input tensors come from the dataset iterator, single sess.run() per step.
+            try:
+                global_step, logits_indices, sentence_lengths, loss, accuracy, f1, output_indices = \
+                    sess.run(fetches, feed_dict={model.is_train: False}, options=runopts)
+            except tf.errors.OutOfRangeError:
+                break
+        else:
+            try:
+                dataset = sess.run(next_element)
+            except tf.errors.OutOfRangeError:
+                break
+            feed_dict = feed.build_feed_dict(model, dataset, False)
+            if 'elmo' in model.config.emb_class and data.elmo_feature_store is not None:
+                # read precomputed biLM layer activations
+                feed_dict[model.elmo_layers] = data.elmo_feature_store.lookup(dataset['ex_index'], np.shape(dataset['word_ids'])[1])
+            if 'bert' in model.config.emb_class and data.bert_feature_store is not None:
+                # read precomputed bert embeddings
+                feed_dict[model.bert_embeddings] = data.bert_feature_store.lookup(dataset['ex_index'], np.shape(dataset['word_ids'])[1])
+            global_step, logits_indices, sentence_lengths, loss, accuracy, f1, output_indices = \
+                sess.run(fetches, feed_dict=feed_dict, options=runopts)
+        idx += 1
+        prog.update(min(idx, data.num_batches),
                     [('dev loss', loss),
                      ('dev accuracy', accuracy),
                      ('dev f1', f1)])
         sum_loss += loss
         sum_accuracy += accuracy
         sum_f1 += f1
-        sum_output_indices = np_concat(sum_output_indices, np.argmax(dataset['tags'], 2))
+        sum_output_indices = np_concat(sum_output_indices, output_indices)
         sum_logits_indices = np_concat(sum_logits_indices, logits_indices)
         sum_sentence_lengths = np_concat(sum_sentence_lengths, sentence_lengths)
-        idx += 1
-    avg_loss = sum_loss / data.num_batches
-    avg_accuracy = sum_accuracy / data.num_batches
-    avg_f1 = sum_f1 / data.num_batches
+    # average over the number of batches actually processed.
+    num_batches = max(1, idx)
+    avg_loss = sum_loss / num_batches
+    avg_accuracy = sum_accuracy / num_batches
+    avg_f1 = sum_f1 / num_batches
     tag_preds = model.config.logits_indices_to_tags_seq(sum_logits_indices, sum_sentence_lengths)
     tag_corrects = model.config.logits_indices_to_tags_seq(sum_output_indices, sum_sentence_lengths)
     tf.logging.debug('\n[epoch %s/%s] dev precision, recall, f1(token): ' % (epoch, model.config.epoch))
@@ -149,7 +228,7 @@ def dev_step(model, data, summary_writer, epoch):
     
     return token_f1, chunk_f1, avg_f1
 
-def fit(model, train_data, dev_data):
+def fit(model, train_data, dev_data, iterator, next_element):
     """Do actual training. 
     """
 
@@ -178,15 +257,27 @@ def fit(model, train_data, dev_data):
 
     # summary setting
     train_summary_op, train_summary_writer, dev_summary_writer = get_summary_setting(model)
-    
+
+    # initializers of the iterator shared by train and dev data
+    train_init_op = iterator.make_initializer(train_data.dataset)
+    dev_init_op = iterator.make_initializer(dev_data.dataset)
+
+    # precompute bert embeddings
+    if 'bert' in config.emb_class and config.use_bert_feature_store:
+        train_data.bert_feature_store = build_bert_feature_store(model, train_data, train_init_op, next_element)
+        dev_data.bert_feature_store = build_bert_feature_store(model, dev_data, dev_init_op, next_element)
+    if 'elmo' in config.emb_class and config.use_elmo_feature_store:
+        train_data.elmo_feature_store = build_elmo_feature_store(model, train_data, train_init_op, next_element)
+        dev_data.elmo_feature_store = build_elmo_feature_store(model, dev_data, dev_init_op, next_element)
+
     # train and evaluate
     early_stopping = EarlyStopping(patience=10, measure='f1', verbose=1)
     max_token_f1 = 0
     max_chunk_f1 = 0
     max_avg_f1 = 0
     for e in range(config.epoch):
-        train_step(model, train_data, train_summary_op, train_summary_writer)
-        token_f1, chunk_f1, avg_f1  = dev_step(model, dev_data, dev_summary_writer, e)
+        train_step(model, train_data, train_init_op, next_element, train_summary_op, train_summary_writer)
+        token_f1, chunk_f1, avg_f1  = dev_step(model, dev_data, dev_init_op, next_element, dev_summary_writer, e)
         # early stopping
         if early_stopping.validate(token_f1, measure='f1'): break
         if token_f1 > max_token_f1 or (max_token_f1 - token_f1 < 0.0005 and chunk_f1 > max_chunk_f1):
@@ -238,20 +329,29 @@ def train(config):
     train_file = 'data/cruise.train.txt.in'
     dev_file = 'data/cruise.dev.txt.in'
     '''
-    train_data = Input(train_file, config, build_output=True, do_shuffle=True, reuse=False)
-    dev_data = Input(dev_file, config, build_output=True, reuse=False)
+    train_data = Input(train_file, config, build_output=True, do_shuffle=True, reuse=True)
+    dev_data = Input(dev_file, config, build_output=True, reuse=True)
     tf.logging.debug('loading input data ... done')
     config.update(train_data)
     tf.logging.debug('config.num_train_steps = %s' % config.num_train_steps)
     tf.logging.debug('config.num_warmup_epoch = %s' % config.num_warmup_epoch)
     tf.logging.debug('config.num_warmup_steps = %s' % config.num_warmup_steps)
 
+    # reinitializable iterator shared by train and dev data
+    iterator = tf.data.Iterator.from_structure(train_data.dataset.output_types, train_data.dataset.output_shapes)
+    next_element = iterator.get_next()
+    # build the graph directly on the iterator output tensors,
+    # except for precomputed bert embeddings, biLM layer activations which are fed from the host.
+    features = next_element
+    if 'bert' in config.emb_class and config.use_bert_feature_store: features = None
+    if 'elmo' in config.emb_class and config.use_elmo_feature_store: features = None
+
     # create model and compile
-    model = Model(config)
+    model = Model(config, features=features)
     model.compile()
 
     # do actual training
-    fit(model, train_data, dev_data)
+    fit(model, train_data, dev_data, iterator, next_element)
         
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
@@ -259,13 +359,21 @@ if __name__ == '__main__':
     parser.add_argument('--wrd_dim', type=int, help='dimension of word embedding vector', required=True)
     parser.add_argument('--word_length', type=int, default=15, help='max word length')
     parser.add_argument('--batch_size', type=int, default=128, help='batch size of training')
+    parser.add_argument('--batch_token_size', type=int, default=0, help='maximum number of tokens per batch(length-bucketed), 0 for fixed batch_size')
+    parser.add_argument('--bucket_width', type=int, default=5, help='width of sentence length buckets for batch_token_size')
     parser.add_argument('--epoch', type=int, default=50, help='number of epochs')
     parser.add_argument('--checkpoint_dir', type=str, default='./checkpoint', help='dir path to save model(ex, ./checkpoint)')
     parser.add_argument('--restore', type=str, default=None, help='path to saved model(ex, ./checkpoint/ner_model)')
     parser.add_argument('--summary_dir', type=str, default='./runs', help='path to save summary(ex, ./runs)')
+    parser.add_argument('--chr_conv_unique', type=str, default='False', help='convolve unique words of a batch only in char-cnn')
+    parser.add_argument('--use_feature_store', type=str, default='False', help='precompute bert embeddings, biLM layer activations once and feed them from memory-mapped store')
 
     args = parser.parse_args()
     tf.logging.set_verbosity(tf.logging.DEBUG)
 
     config = Config(args, is_training=True, emb_class='glove', use_crf=True)
+    config.chr_conv_unique = args.chr_conv_unique == 'True'
+    # without feature stores, the graph is built directly on the iterator output tensors.
+    if 'bert' in config.emb_class: config.use_bert_feature_store = args.use_feature_store == 'True'
+    if 'elmo' in config.emb_class: config.use_elmo_feature_store = args.use_feature_store == 'True'
     train(config)
@@ -0,0 +1,54 @@
+from __future__ import print_function
+import collections
+
+class CachedTokenizer:
+
+    def __init__(self, tokenizer, do_lower_case, cache_size=100000):
+        """Bounded per-word cache of WordPiece tokens and ids over bert FullTokenizer.
+
+        Args:
+          tokenizer: an instance of bert tokenization.FullTokenizer.
+          do_lower_case: do_lower_case of the tokenizer, a part of cache key.
+          cache_size: maximum number of cached words(least recently used ones are evicted).
+        """
+        self.tokenizer = tokenizer
+        self.do_lower_case = do_lower_case
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.cls_id = self.tokenizer.convert_tokens_to_ids(['[CLS]'])[0]
+
+    def tokenize(self, text):
+        return self.tokenizer.tokenize(text)
+
+    def convert_tokens_to_ids(self, tokens):
+        return self.tokenizer.convert_tokens_to_ids(tokens)
+
+    def tokenize_word(self, word):
+        """Tokenize a word to word pieces.
+
+        Returns:
+          (tokens, token ids)
+        """
+        key = (word, self.do_lower_case)
+        entry = self.cache.get(key)
+        if entry is not None:
+            # mark as recently used.
+            del self.cache[key]
+            self.cache[key] = entry
+            return entry
+        tokens = self.tokenizer.tokenize(word)
+        entry = (tokens, self.tokenizer.convert_tokens_to_ids(tokens))
+        self.cache[key] = entry
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return entry
+
+    def tokenize_bucket(self, bucket):
+        """Tokenize words of a bucket.
+
+        Args:
+          bucket: list of 'word pos chk tag' lines.
+        Returns:
+          list of (tokens, token ids) for each word.
+        """
+        return [self.tokenize_word(line.split()[0]) for line in bucket]